@@ -1,10 +1,36 @@
-from simgrid import Engine, this_actor, Mailbox, Comm
+from simgrid import Engine, this_actor, Mailbox, Comm, TimeoutException
 import random
+import argparse
+import json
+import math
 from enum import Enum
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from collections import deque
+from ghs_trace import Event, TraceSink, MODES as TRACE_MODES
+from ghs_graph import parse_links
 
-INF = 100
+# Edges are totally ordered by their key (weight, min id, max id), which makes non-distinct weights
+# unique. A fragment is identified by the key of its core edge, and INF is greater than every key.
+INF = (math.inf,)
+
+# How nodes wait for messages: "poll" tests the mailbox between random computations,
+# "timed" blocks on the mailbox until a message arrives or the self-awakening budget expires
+RECEIVE_MODE = "poll"
+
+# Seed of the run: each node derives its own random streams from it, so that a run can be
+# reproduced whatever the order in which nodes draw numbers (None: not reproducible)
+RUN_SEED = None
+
+# Wake-up schedule of every node: self-awakening threshold and seed of its polling steps.
+# Filled while the nodes start, or loaded beforehand to replay the schedule of another run.
+SCHEDULE = {}
+
+# Where the events of the nodes go, replaced according to the --trace option
+TRACE = TraceSink("text", log = this_actor.info, clock = lambda: Engine.clock)
+
+# Number of pending sends that triggers the first sweep of the completed ones
+PENDING_COMMS_REAP_SIZE = 64
 
 class NodeState(Enum):
   SLEEPING = 0
@@ -19,8 +45,10 @@ class EdgeState(Enum):
 @dataclass
 class Edge:
   dNode: int
-  weight: int
+  weight: float
   state: EdgeState
+  key: tuple
+  mailbox: Mailbox = field(default = None, repr = False, compare = False)
 
   @property
   def toString(self):
@@ -36,22 +64,55 @@ class MessageType(Enum):
   CHANGE_ROOT = 6
   TERMINATE = 7
 
-@dataclass
+# Wire format of the messages, in bits. Besides its type and its sender, a message only
+# carries O(log n)-bit fields, and its simulated transfer size is derived from this format.
+TYPE_BITS = 3
+ID_BITS = 32
+LEVEL_BITS = 8
+WEIGHT_BITS = 64
+KEY_BITS = WEIGHT_BITS + 2 * ID_BITS
+STATE_BITS = 1
+
+def wire_size_in_bytes(*field_bits):
+  return (TYPE_BITS + ID_BITS + sum(field_bits) + 7) // 8
+
 class Message:
-  source: int
-  msg_type: MessageType
+  __slots__ = ("source",)
+  msg_type = None
+  WIRE_SIZE = wire_size_in_bytes()
+
+  def __init__(self, source: int):
+      self.source = source
+
+  def toString(self):
+    return ""
+
+  # (level, key, value) fields of the message in the trace
+  def trace_fields(self):
+    return -1, None, 0
 
 class ConnectMessage(Message):
+  __slots__ = ("level",)
+  msg_type = MessageType.CONNECT
+  WIRE_SIZE = wire_size_in_bytes(LEVEL_BITS)
+
   def __init__(self, source: int, level: int):
-      super().__init__(source=source, msg_type=MessageType.CONNECT)
+      self.source = source
       self.level = level
 
   def toString(self):
     return f"Level = {self.level}"
 
+  def trace_fields(self):
+    return self.level, None, 0
+
 class InitiateMessage(Message):
-  def __init__(self, source: int, level: int, fragment_id: int, state: int):
-      super().__init__(source=source, msg_type=MessageType.INITIATE)
+  __slots__ = ("level", "fragment_id", "state")
+  msg_type = MessageType.INITIATE
+  WIRE_SIZE = wire_size_in_bytes(LEVEL_BITS, KEY_BITS, STATE_BITS)
+
+  def __init__(self, source: int, level: int, fragment_id: tuple, state: int):
+      self.source = source
       self.level = level
       self.fragment_id = fragment_id
       self.state = state
@@ -59,42 +120,119 @@ class InitiateMessage(Message):
   def toString(self):
     return f"Level = {self.level}, Fragment id = {self.fragment_id}, State = {self.state}"
 
+  def trace_fields(self):
+    return self.level, self.fragment_id, self.state.value
+
 class TestMessage(Message):
-  def __init__(self, source: int, level: int, fragment_id: int):
-      super().__init__(source=source, msg_type=MessageType.TEST)
+  __slots__ = ("level", "fragment_id")
+  msg_type = MessageType.TEST
+  WIRE_SIZE = wire_size_in_bytes(LEVEL_BITS, KEY_BITS)
+
+  def __init__(self, source: int, level: int, fragment_id: tuple):
+      self.source = source
       self.level = level
       self.fragment_id = fragment_id
 
   def toString(self):
     return f"Level = {self.level}, Fragment id = {self.fragment_id}"
 
+  def trace_fields(self):
+    return self.level, self.fragment_id, 0
+
 class ReportMessage(Message):
-  def __init__(self, source: int, best_wt: int):
-      super().__init__(source=source, msg_type=MessageType.REPORT)
+  __slots__ = ("best_wt",)
+  msg_type = MessageType.REPORT
+  WIRE_SIZE = wire_size_in_bytes(KEY_BITS)
+
+  def __init__(self, source: int, best_wt: tuple):
+      self.source = source
       self.best_wt = best_wt
 
   def toString(self):
     return f"Best weight = {self.best_wt}"
 
+  def trace_fields(self):
+    return -1, self.best_wt, 0
+
 class AcceptMessage(Message):
-  def __init__(self, source: int):
-      super().__init__(source=source, msg_type=MessageType.ACCEPT)
+  __slots__ = ()
+  msg_type = MessageType.ACCEPT
 
 class RejectMessage(Message):
-  def __init__(self, source: int):
-      super().__init__(source=source, msg_type=MessageType.REJECT)
+  __slots__ = ()
+  msg_type = MessageType.REJECT
 
 class ChangeRootMessage(Message):
-  def __init__(self, source: int):
-      super().__init__(source=source, msg_type=MessageType.CHANGE_ROOT)
+  __slots__ = ()
+  msg_type = MessageType.CHANGE_ROOT
 
 class TerminateMessage(Message):
+  __slots__ = ("leader",)
+  msg_type = MessageType.TERMINATE
+  WIRE_SIZE = wire_size_in_bytes(ID_BITS)
+
   def __init__(self, source: int, leader: int):
-      super().__init__(source=source, msg_type=MessageType.TERMINATE)
+      self.source = source
       self.leader = leader
+
   def toString(self):
     return f"Leader = {self.leader}"
 
+  def trace_fields(self):
+    return -1, None, self.leader
+
+# Message and time complexity counters of a run, dumped as JSON once the simulation is over
+class RunStats:
+  def __init__(self):
+    self.messages_by_type = {t.name: 0 for t in MessageType}
+    self.bytes_by_type = {t.name: 0 for t in MessageType}
+    self.messages_by_level = {}
+    self.messages_by_node = {}
+    self.deferred_by_node = {}
+    self.nodes = 0
+    self.degree_sum = 0
+    self.completion_time = 0
+    # Simulated activities started by the nodes (sends, receives and computations)
+    self.activities = 0
+
+  def count_send(self, node, level, payload, count = 1):
+    self.activities += count
+    self.messages_by_type[payload.msg_type.name] += count
+    self.bytes_by_type[payload.msg_type.name] += count * payload.WIRE_SIZE
+    self.messages_by_level[level] = self.messages_by_level.get(level, 0) + count
+    self.messages_by_node[node] = self.messages_by_node.get(node, 0) + count
+
+  def count_finished(self, node):
+    self.nodes += 1
+    self.degree_sum += len(node.adjacent_edges)
+    self.deferred_by_node[node.id] = node.deferred_count
+    self.completion_time = max(self.completion_time, Engine.clock)
+
+  def summary(self):
+    n = self.nodes
+    e = self.degree_sum // 2
+    messages = sum(self.messages_by_type.values())
+    return {
+      "nodes": n,
+      "edges": e,
+      "messages": messages,
+      "message_bound": round(5 * n * math.log2(n) + 2 * e, 1) if n > 1 else 2 * e, # 5 N log N + 2 E
+      "bytes": sum(self.bytes_by_type.values()),
+      "deferred": sum(self.deferred_by_node.values()),
+      "completion_time": self.completion_time,
+      "simulated_time": Engine.clock,
+      "activities": self.activities,
+      "max_level": max(self.messages_by_level, default = 0),
+      "messages_by_type": self.messages_by_type,
+      "bytes_by_type": self.bytes_by_type,
+      "messages_by_level": {str(level): count for level, count in sorted(self.messages_by_level.items())},
+      "messages_by_node": {str(node): count for node, count in sorted(self.messages_by_node.items())},
+      "deferred_by_node": {str(node): count for node, count in sorted(self.deferred_by_node.items())},
+    }
+
+# Counters of the current run
+STATS = RunStats()
+
 class Node:
   def print_adjacent_edges(self):
     msg = ""
@@ -103,26 +241,93 @@ class Node:
     this_actor.info(f"My adjacent edges are: {msg}")
 
   def get_adjacent_edges(self, links):
+    # links: "@<edge file>", "dst:weight ..." or a dense adjacency row, see ghs_graph.parse_links
     adjacent_edges = []
-    for neighbour, distance in enumerate(links):
-      if int(distance) > 0:
-        adjacent_edges.append(Edge(dNode = int(neighbour), weight = int(distance), state = EdgeState.BASIC))
+    edge_by_dNode = {}
+    for neighbour, distance in parse_links(self.id, links):
+      edge = Edge(dNode = neighbour, weight = distance, state = EdgeState.BASIC,
+                  key = (distance, min(self.id, neighbour), max(self.id, neighbour)),
+                  mailbox = Mailbox.by_name(str(neighbour)))
+      adjacent_edges.append(edge)
+      edge_by_dNode[neighbour] = edge
+    # Sorted by key once, so the minimum-weight Basic edge is found by moving a cursor
+    adjacent_edges.sort(key = lambda x: x.key)
     self.adjacent_edges = adjacent_edges
+    # Position of the first edge that may still be Basic (edges never return to Basic)
+    self.basic_cursor = 0
+    # Index from neighbour id to edge, so that every received message resolves its edge in O(1)
+    self.edge_by_dNode = edge_by_dNode
 
   def get_edge_by_dNode(self, dNode):
-    for edge in self.adjacent_edges:
-      if edge.dNode == dNode:
-        return edge
+    return self.edge_by_dNode.get(dNode)
+
+  # Send a message on an edge, through the mailbox resolved once for the edge
+  def send(self, edge, payload):
+    comm = edge.mailbox.put_async(payload, payload.WIRE_SIZE)
+    self.track_comm(comm)
+    STATS.count_send(self.id, self.level, payload)
+    self.trace(Event.SEND, edge.dNode, payload)
+
+  # Send one payload on every edge except `exclude`, for the Initiate and Terminate broadcasts.
+  # Messages are never modified once sent, so all the recipients share the same payload object.
+  # Returns the number of messages sent
+  def broadcast(self, edges, payload, exclude = None):
+    recipients = [edge for edge in edges if edge is not exclude]
+    if not recipients:
+      return 0
+    self.track_comm(*[edge.mailbox.put_async(payload, payload.WIRE_SIZE) for edge in recipients])
+    STATS.count_send(self.id, self.level, payload, len(recipients))
+    if TRACE.records(Event.SEND):
+      for edge in recipients:
+        self.trace(Event.SEND, edge.dNode, payload)
+    return len(recipients)
+
+  # Record an event of this node in the trace, see ghs_trace.Event for the meaning of peer and value
+  def trace(self, event, peer = -1, msg = None, value = 0):
+    if TRACE.records(event):
+      if msg is None:
+        TRACE.record(self.id, event, peer, value = value)
+      else:
+        level, key, value = msg.trace_fields()
+        TRACE.record(self.id, event, peer, msg.msg_type.value, level, key, value)
+
+  # Keep a send until it completes. Completed sends are reaped whenever the list doubles,
+  # so its size stays proportional to the messages in flight rather than to all messages sent
+  def track_comm(self, *comms):
+    self.pending_comms.extend(comms)
+    if len(self.pending_comms) >= self.pending_comms_limit:
+      self.pending_comms = [pending_comm for pending_comm in self.pending_comms if not pending_comm.test()]
+      self.pending_comms_limit = max(PENDING_COMMS_REAP_SIZE, 2 * len(self.pending_comms))
+
+  # SE(edge) <- Branch, also keeping the edge in the Branch edges used by the tree broadcasts
+  def set_branch(self, edge):
+    if edge.state != EdgeState.BRANCH:
+      edge.state = EdgeState.BRANCH
+      self.branch_edges.append(edge)
+
+  # Place received message at the end of the local queue of deferred messages
+  def defer(self, msg):
+    self.deferred_messages.append(msg)
+    self.deferred_count += 1
+
+  # Re-examine the deferred messages, only once the state that blocked them has changed
+  # (a Connect, Test or Report waits for the level, the node state, the in-branch or its edge to change)
+  def process_deferred_messages(self):
+    while self.state_changed and not self.halt:
+      self.state_changed = False
+      for _ in range(len(self.deferred_messages)):
+        self.dispatch(self.deferred_messages.popleft())
 
   # procedure wakeup
   def wakeup(self):
     # Let m be adjacent edge of minimum weight
-    m = min(self.adjacent_edges, key = lambda x: x.weight)
-    this_actor.debug(f"Minimum adjacent edge is: " + m.toString)
+    m = self.adjacent_edges[0]
+    if TRACE.verbose:
+      this_actor.info(f"Minimum adjacent edge is: " + m.toString)
 
     # SE(m) <- Branch
-    m.state = EdgeState.BRANCH
-    this_actor.info(f"[BRANCH to {m.dNode}] () : {{}}")
+    self.set_branch(m)
+    self.trace(Event.BRANCH, m.dNode)
 
     # LN <- 0
     self.level = 0
@@ -134,12 +339,7 @@ class Node:
     self.find_count = 0
 
     # Send Connect(O) on edge m
-    mailboxTo = Mailbox.by_name(str(m.dNode))
-    payload = ConnectMessage(source = self.id, level = self.level)
-    payload_size_in_bytes = sys.getsizeof(payload)
-    comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-    self.pending_comms.append(comm)
-    this_actor.info(f"[{MessageType.CONNECT.name} to {m.dNode}] ({self.id} -- Connect --> {m.dNode}) : {{{payload.toString()}}}")
+    self.send(m, ConnectMessage(source = self.id, level = self.level))
     #this_actor.info(self.toString())
 
   # procedure report
@@ -148,31 +348,32 @@ class Node:
     if self.find_count == 0 and self.test_edge is None:
       # SN <- Found
       self.state = NodeState.FOUND
+      self.state_changed = True
       # send Report(best-wt) on in-branch
-      mailboxTo = Mailbox.by_name(str(self.in_branch.dNode))
-      payload = ReportMessage(source = self.id, best_wt = self.best_wt)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.REPORT.name} to {self.in_branch.dNode}] ({self.id} -- Report --> {self.in_branch.dNode}) : {{{payload.toString()}}}")
+      self.send(self.in_branch, ReportMessage(source = self.id, best_wt = self.best_wt))
       #this_actor.info(self.toString())
       
+  # Minimum-weight adjacent edge in state Basic, or None.
+  # Branch and Rejected edges are skipped lazily: they never become Basic again.
+  def min_basic_edge(self):
+    while self.basic_cursor < len(self.adjacent_edges):
+      edge = self.adjacent_edges[self.basic_cursor]
+      if edge.state == EdgeState.BASIC:
+        return edge
+      self.basic_cursor += 1
+    return None
+
   # procedure test
   def test(self):
-    basic_adjacent_edges = [edge for edge in self.adjacent_edges if edge.state == EdgeState.BASIC]
-    this_actor.info(f"Basic adjacent edges nr: {len(basic_adjacent_edges)}")
+    min_basic_edge = self.min_basic_edge()
     # If there are adjacent edges in the state Basic
-    if len(basic_adjacent_edges) > 0:
+    if min_basic_edge is not None:
       # test-edge <- the minimum-weight adjacent edge in state Basic;
-      self.test_edge = min(basic_adjacent_edges, key = lambda x: x.weight)
-      this_actor.info(f"Min Basic adjacent edge: {self.test_edge}")
+      self.test_edge = min_basic_edge
+      if TRACE.verbose:
+        this_actor.info(f"Min Basic adjacent edge: {self.test_edge}")
       # send Test(LN, FN) on test-edge
-      mailboxTo = Mailbox.by_name(str(self.test_edge.dNode))
-      payload = TestMessage(source = self.id, level = self.level, fragment_id = self.fragment_id)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.TEST.name} to {self.test_edge.dNode}] ({self.id} -- Test --> {self.test_edge.dNode}) : {{{payload.toString()}}}")
+      self.send(self.test_edge, TestMessage(source = self.id, level = self.level, fragment_id = self.fragment_id))
       #this_actor.info(self.toString())
       
     else:
@@ -184,35 +385,27 @@ class Node:
   # procedure change-root
   def change_root(self):
     # if SE(best-edge) = Branch
-    this_actor.info("ChangeRoot" + self.toString())
+    if TRACE.verbose:
+      this_actor.info("ChangeRoot" + self.toString())
     if self.best_edge.state == EdgeState.BRANCH:
       # send Change-root on best-edge
-      mailboxTo = Mailbox.by_name(str(self.best_edge.dNode))
-      payload = ChangeRootMessage(source = self.id)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.CHANGE_ROOT.name} to {self.best_edge.dNode}] ({self.id} -- Change Root --> {self.best_edge.dNode}) : {{}}")
+      self.send(self.best_edge, ChangeRootMessage(source = self.id))
       #this_actor.info(self.toString())
       
     # else
     else:
       # send Connect(LN) on best-edge;
-      mailboxTo = Mailbox.by_name(str(self.best_edge.dNode))
-      payload = ConnectMessage(source = self.id, level = self.level)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.CONNECT.name} to {self.best_edge.dNode}] ({self.id} -- Connect --> {self.best_edge.dNode}) : {{{payload.toString()}}}")
+      self.send(self.best_edge, ConnectMessage(source = self.id, level = self.level))
       #this_actor.info(self.toString())
       
       # SE(best-edge) <- Branch
-      self.best_edge.state = EdgeState.BRANCH
-      this_actor.info(f"[BRANCH to {self.best_edge.dNode}] () : {{}}")
+      self.set_branch(self.best_edge)
+      self.state_changed = True
+      self.trace(Event.BRANCH, self.best_edge.dNode)
 
   # Response to receipt of Connect(L) on edge j
   def handleConnect(self, msg):
-    this_actor.info(f"[{MessageType.CONNECT.name} from {msg.source}] ({self.id} <-- Connect -- {msg.source}) : {{{msg.toString()}}}")
+    self.trace(Event.RECEIVE, msg.source, msg)
     #this_actor.info(self.toString())
       
     # Get edge j
@@ -221,16 +414,11 @@ class Node:
     # If L < LN (ABSORPTION)
     if msg.level < self.level:
       # SE(j) <- Branch
-      j.state = EdgeState.BRANCH
-      this_actor.info(f"[BRANCH to {j.dNode}] () : {{}}")
+      self.set_branch(j)
+      self.trace(Event.BRANCH, j.dNode)
 
       # Send Initiate(LN, FN, SN) on edge j
-      mailboxTo = Mailbox.by_name(str(msg.source))
-      payload = InitiateMessage(source = self.id, level = self.level, fragment_id = self.fragment_id, state = self.state)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.INITIATE.name} to {msg.source}] ({self.id} -- Initiate --> {msg.source}) : {{{payload.toString()}}}")
+      self.send(j, InitiateMessage(source = self.id, level = self.level, fragment_id = self.fragment_id, state = self.state))
       #this_actor.info(self.toString())
 
       # if SN = Find
@@ -241,27 +429,22 @@ class Node:
     # Else if SE(j) = Basic (Wait for the situation to change)
     elif j.state == EdgeState.BASIC:
       # Place received message at the end of queue
-      mailboxTo = Mailbox.by_name(str(self.id))
-      payload_size_in_bytes = 0
-      comm = mailboxTo.put_async(msg, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[Place received {MessageType.CONNECT.name} message from {msg.source} at the end of queue!] () : {{}}")
+      self.defer(msg)
+      self.trace(Event.DEFER, msg.source, msg)
       #this_actor.info(self.toString())
       
     # (MERGE) The fragment receving the Connect has also sent a Connect to the other fragment.
     else:
+      # j becomes the core edge of the merged fragment
+      self.core_edge = j
+
       # Send Initiate(LN + 1, w(j), Find) on edge j
-      mailboxTo = Mailbox.by_name(str(msg.source))
-      payload = InitiateMessage(source = self.id, level = self.level + 1, fragment_id = j.weight, state = NodeState.FIND)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.INITIATE.name} to {msg.source}] ({self.id} -- Initiate --> {msg.source}) : {{{payload.toString()}}}")
+      self.send(j, InitiateMessage(source = self.id, level = self.level + 1, fragment_id = j.key, state = NodeState.FIND))
       #this_actor.info(self.toString())
       
   # Response to receipt of Initiate (L, F, S) on edge j
   def handleInitiate(self, msg):
-    this_actor.info(f"[{MessageType.INITIATE.name} from {msg.source}] ({self.id} <-- Initiate -- {msg.source}) : {{{msg.toString()}}}")
+    self.trace(Event.RECEIVE, msg.source, msg)
     #this_actor.info(self.toString())
       
     # Get edge j
@@ -279,31 +462,25 @@ class Node:
     # in-branch <- j
     self.in_branch = j
 
+    # The Initiate crossed the core edge if the fragment id is the key of j
+    self.core_edge = j if msg.fragment_id == j.key else None
+
+    self.state_changed = True
+
     # best-edge <- nil
     self.best_edge = None
 
     # best-wt <- inf
     self.best_wt = INF
 
-    for edge in self.adjacent_edges:
-      # for all i ≠ j such that SE(i) = Branch
-      if edge != j and edge.state == EdgeState.BRANCH:
-        # send Initiate(L, F, S) on edge i
-        mailboxTo = Mailbox.by_name(str(edge.dNode))
-        payload = InitiateMessage(source = self.id, level = msg.level, fragment_id = msg.fragment_id, state = msg.state)
-        payload_size_in_bytes = sys.getsizeof(payload)
-        comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-        self.pending_comms.append(comm)
-        this_actor.info(f"[{MessageType.INITIATE.name} to {edge.dNode}] ({self.id} -- Initiate --> {edge.dNode}) : {{{payload.toString()}}}")
-        #this_actor.info(self.toString())
-      
-        # if S = Find
-        if msg.state == NodeState.FIND:
-          # find-count <- find-count + 1
-          self.find_count += 1
+    # for all i ≠ j such that SE(i) = Branch: send Initiate(L, F, S) on edge i
+    sent = self.broadcast(self.branch_edges, InitiateMessage(source = self.id, level = msg.level, fragment_id = msg.fragment_id, state = msg.state), exclude = j)
+    #this_actor.info(self.toString())
 
     # if S = Find
     if msg.state == NodeState.FIND:
+      # find-count <- find-count + 1, once per Initiate sent
+      self.find_count += sent
       # execute procedure test
       self.test()
 
@@ -311,28 +488,20 @@ class Node:
   def handleTest(self, msg):
     # Get edge j
     j = self.get_edge_by_dNode(msg.source)
-    this_actor.info(f"[{MessageType.TEST.name} from {j.dNode}] ({self.id} <-- Test -- {j.dNode}) : {{{msg.toString()}}}")
+    self.trace(Event.RECEIVE, j.dNode, msg)
     #this_actor.info(self.toString())
       
     # If L > LN
     if msg.level > self.level:
       # Place received message at the end of queue
-      mailboxTo = Mailbox.by_name(str(self.id))
-      payload_size_in_bytes = 0
-      comm = mailboxTo.put_async(msg, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[Place received {MessageType.TEST.name} message from {msg.source} at the end of queue!] () : {{}}")
+      self.defer(msg)
+      self.trace(Event.DEFER, msg.source, msg)
       #this_actor.info(self.toString())
       
     # else if F != FN
     elif msg.fragment_id != self.fragment_id:
       # send Accept on edge j
-      mailboxTo = Mailbox.by_name(str(j.dNode))
-      payload = AcceptMessage(source = self.id)
-      payload_size_in_bytes = sys.getsizeof(payload)
-      comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[{MessageType.ACCEPT.name} to {j.dNode}] ({self.id} -- Accept --> {j.dNode}) : {{}}")
+      self.send(j, AcceptMessage(source = self.id))
       #this_actor.info(self.toString())
       
     else: # same fragment
@@ -340,16 +509,11 @@ class Node:
       if j.state == EdgeState.BASIC:
         # SE(j) = Rejected
         j.state = EdgeState.REJECTED
-        this_actor.info(f"[REJECTED to {j.dNode}] () : {{}}")
+        self.trace(Event.REJECTED, j.dNode)
       # if test-edge != j 
       if self.test_edge != j:
         # send Reject on edge j
-        mailboxTo = Mailbox.by_name(str(j.dNode))
-        payload = RejectMessage(source = self.id)
-        payload_size_in_bytes = sys.getsizeof(payload)
-        comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-        self.pending_comms.append(comm)
-        this_actor.info(f"[{MessageType.REJECT.name} to {j.dNode}] ({self.id} -- Reject --> {j.dNode}) : {{}}")
+        self.send(j, RejectMessage(source = self.id))
         #this_actor.info(self.toString())
       
       else:
@@ -360,8 +524,9 @@ class Node:
   def handleReport(self, msg):
     # Get edge j
     j = self.get_edge_by_dNode(msg.source)
-    this_actor.info(f"[{MessageType.REPORT.name} from {j.dNode}] ({self.id} <-- Report -- {j.dNode}) : {{{msg.toString()}}}")
-    this_actor.info(self.toString())  
+    self.trace(Event.RECEIVE, j.dNode, msg)
+    if TRACE.verbose:
+      this_actor.info(self.toString())
 
     # if j != in-branch 
     if j != self.in_branch:
@@ -378,11 +543,8 @@ class Node:
     # else if SN = Find
     elif self.state == NodeState.FIND:
       # place received message on end of queue
-      mailboxTo = Mailbox.by_name(str(self.id))
-      payload_size_in_bytes = 0
-      comm = mailboxTo.put_async(msg, payload_size_in_bytes)
-      self.pending_comms.append(comm)
-      this_actor.info(f"[Place received {MessageType.REPORT.name} message from {msg.source} at the end of queue!] () : {{}}")
+      self.defer(msg)
+      self.trace(Event.DEFER, msg.source, msg)
       #this_actor.info(self.toString())
     # else if w > best-wt
     elif msg.best_wt > self.best_wt:
@@ -392,40 +554,27 @@ class Node:
     elif msg.best_wt == self.best_wt and self.best_wt == INF:
       # halt
       self.halt = True
-      for edge in self.adjacent_edges:
-        if edge.weight == self.fragment_id:
-          if edge.dNode < self.id:
-            leader = edge.dNode
-          else:
-            leader = self.id
-
-      self.leader = leader
+      # The leader is the smallest end of the core edge
+      self.leader = min(self.id, self.core_edge.dNode)
 
-      for edge in self.adjacent_edges:
-        if edge.state == EdgeState.BRANCH:
-          mailboxTo = Mailbox.by_name(str(edge.dNode))
-          payload = TerminateMessage(source = self.id, leader = self.leader)
-          payload_size_in_bytes = sys.getsizeof(payload)
-          comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-          self.pending_comms.append(comm)
-          this_actor.info(f"[{MessageType.TERMINATE.name} to {edge.dNode}] ({self.id} -- Terminate --> {edge.dNode}) : {{{payload.toString()}}}")
-          
+      self.broadcast(self.branch_edges, TerminateMessage(source = self.id, leader = self.leader))
+        
 
   # Response to receipt of Accept on edge j 
   def handleAccept(self, msg):
     # Get edge j
     j = self.get_edge_by_dNode(msg.source)
-    this_actor.info(f"[{MessageType.ACCEPT.name} from {j.dNode}] ({self.id} <-- Accept -- {j.dNode}) : {{}}")
+    self.trace(Event.RECEIVE, j.dNode, msg)
     #this_actor.info(self.toString())
       
     # test-edge <- nil
     self.test_edge = None
     # if w(j) < best-wt
-    if j.weight < self.best_wt:
+    if j.key < self.best_wt:
       # best-edge <- j
       self.best_edge = j
       # best-wt <- w(j)
-      self.best_wt = j.weight
+      self.best_wt = j.key
     # execute procedure report
     self.report()
 
@@ -433,50 +582,49 @@ class Node:
   def handleReject(self, msg):
     # Get edge j
     j = self.get_edge_by_dNode(msg.source)
-    this_actor.info(f"[{MessageType.REJECT.name} from {j.dNode}] ({self.id} <-- Reject -- {j.dNode}) : {{}}")
+    self.trace(Event.RECEIVE, j.dNode, msg)
     #this_actor.info(self.toString())
       
     # if SE(j) = Basic
     if j.state == EdgeState.BASIC:
       # SE(j) <- Rejected
       j.state = EdgeState.REJECTED
-      this_actor.info(f"[REJECTED to {j.dNode}] () : {{}}")
+      self.trace(Event.REJECTED, j.dNode)
     # execute procedure test
     self.test()
 
   # Response to receipt of Change-root
   def handleChangeRoot(self, msg):
-    this_actor.info(f"[{MessageType.CHANGE_ROOT.name} from {msg.source}] ({self.id} <-- Change Root -- {msg.source}) : {{}}")
+    self.trace(Event.RECEIVE, msg.source, msg)
     #this_actor.info(self.toString())
       
     # execute procedure change-root
     self.change_root()
 
   def handleTerminate(self, msg):
-    this_actor.info(f"[{MessageType.TERMINATE.name} from {msg.source}] ({self.id} <-- Terminate -- {msg.source}) : {{{msg.toString()}}}")
+    self.trace(Event.RECEIVE, msg.source, msg)
     j = self.get_edge_by_dNode(msg.source)
 
     self.leader = msg.leader
 
-    for edge in self.adjacent_edges:
-      if edge.dNode != j.dNode and edge.state == EdgeState.BRANCH:
-        mailboxTo = Mailbox.by_name(str(edge.dNode))
-        payload = TerminateMessage(source = self.id, leader = self.leader)
-        payload_size_in_bytes = sys.getsizeof(payload)
-        comm = mailboxTo.put_async(payload, payload_size_in_bytes)
-        self.pending_comms.append(comm)
-        this_actor.info(f"[{MessageType.TERMINATE.name} to {edge.dNode}] ({self.id} -- Terminate --> {edge.dNode}) : {{{payload.toString()}}}")
+    self.broadcast(self.branch_edges, TerminateMessage(source = self.id, leader = self.leader), exclude = j)
 
     self.halt = True
 
   def __init__(self, id, links):
     # Parse arguments
     self.id = int(id)
-    self.get_adjacent_edges(links.split())
+    self.get_adjacent_edges(links)
 
     # Create async communication endpoint
     self.mailbox = Mailbox.by_name(str(self.id))
     self.pending_comms = []
+    self.pending_comms_limit = PENDING_COMMS_REAP_SIZE
+
+    # Messages that cannot be processed yet in the current state
+    self.deferred_messages = deque()
+    self.deferred_count = 0
+    self.state_changed = False
 
     # Start sleeping phase
     self.state = NodeState.SLEEPING
@@ -488,6 +636,8 @@ class Node:
     self.best_wt = None
     self.test_edge = None
     self.in_branch = None
+    self.core_edge = None
+    self.branch_edges = []
     self.find_count = None
     self.halt = None
     self.leader = None
@@ -495,83 +645,148 @@ class Node:
   def toString(self):
     return f"Node: {self.id}, Edges: {self.adjacent_edges}, State: {self.state.name}, Fragment id: {self.fragment_id}, Level: {self.level}, Best edge: {self.best_edge}, Best weight: {self.best_wt}, Test edge: {self.test_edge}, In branch: {self.in_branch}, Find Count: {self.find_count}, Halt: {self.halt}"
 
-  def __call__(self):
-    total_compute_size_in_flops = 0 # how many computations did so far while in sleepy state
-    max_total_compute_size_in_flops = random.randint(5, 50) # threshold for self-awakening
-    self.halt = False
-    while not self.halt: # Start asynchronous algorithm
-      result_comm, async_data = self.mailbox.get_async() # Initiate the receive operation (does not complete it)
-      
-      while not result_comm.test(): # Check any message received
-        # While asynchronously waiting for messages, do <random_nr> flops computation, then check again
-        # Since each node has 1 flops speed, this is the same as sleeping for <random_nr> seconds
-        compute_size_in_flops = random.randint(1, 10)
-        this_actor.execute(compute_size_in_flops)
-        #this_actor.info("waiting")
-        ##this_actor.info(self.toString())
-
-        # If node does not get any message for a known period of time, it spontaneously awakes
-        if self.state == NodeState.SLEEPING:
-          total_compute_size_in_flops += compute_size_in_flops
-          # Execute procedure wakeup (cause: self-awakened)
-          if total_compute_size_in_flops >= max_total_compute_size_in_flops:
-            this_actor.info(f"[SELF-AWAKENED] (Did {total_compute_size_in_flops} flops, more or equal than {max_total_compute_size_in_flops} flop limit!) : {{}}")
-            #this_actor.info(self.toString())
-            self.wakeup()
-
-      msg = async_data.get()
-
-      if msg.msg_type == MessageType.CONNECT:
-        # Execute procedure wakeup (cause: awakened by another node)
-        if self.state == NodeState.SLEEPING:
-          this_actor.info(f"[AWAKENED by {msg.source}] (Did {total_compute_size_in_flops} flops, less than {max_total_compute_size_in_flops} flop limit!) : {{}}")
-          #this_actor.info(self.toString())
-          self.wakeup()
-        self.handleConnect(msg)
+  def dispatch(self, msg):
+    if msg.msg_type == MessageType.CONNECT:
+      # Execute procedure wakeup (cause: awakened by another node)
+      if self.state == NodeState.SLEEPING:
+        self.trace(Event.AWAKENED, msg.source, value = self.total_compute_size_in_flops)
+        #this_actor.info(self.toString())
+        self.wakeup()
+      self.handleConnect(msg)
 
-      elif msg.msg_type == MessageType.INITIATE:
-        self.handleInitiate(msg)
+    elif msg.msg_type == MessageType.INITIATE:
+      self.handleInitiate(msg)
 
-      elif msg.msg_type == MessageType.TEST:
-        # Execute procedure wakeup (cause: awakened by another node)
-        if self.state == NodeState.SLEEPING:
-          this_actor.info(f"[AWAKENED by {msg.source}] (Did {total_compute_size_in_flops} flops, less than {max_total_compute_size_in_flops} flop limit!) : {{}}")
+    elif msg.msg_type == MessageType.TEST:
+      # Execute procedure wakeup (cause: awakened by another node)
+      if self.state == NodeState.SLEEPING:
+        self.trace(Event.AWAKENED, msg.source, value = self.total_compute_size_in_flops)
+        #this_actor.info(self.toString())
+        self.wakeup()
+      self.handleTest(msg)
+
+    elif msg.msg_type == MessageType.REPORT:
+      self.handleReport(msg)
+
+    elif msg.msg_type == MessageType.ACCEPT:
+      self.handleAccept(msg)
+
+    elif msg.msg_type == MessageType.REJECT:
+      self.handleReject(msg)
+
+    elif msg.msg_type == MessageType.CHANGE_ROOT:
+      self.handleChangeRoot(msg)
+
+    elif msg.msg_type == MessageType.TERMINATE:
+      self.handleTerminate(msg)
+
+  # Receive the next message by testing the mailbox between random computations
+  def receive_polling(self):
+    result_comm, async_data = self.mailbox.get_async() # Initiate the receive operation (does not complete it)
+    STATS.activities += 1
+
+    while not result_comm.test(): # Check any message received
+      # While asynchronously waiting for messages, do <random_nr> flops computation, then check again
+      # Since each node has 1 flops speed, this is the same as sleeping for <random_nr> seconds
+      compute_size_in_flops = self.poll_rng.randint(1, 10)
+      this_actor.execute(compute_size_in_flops)
+      STATS.activities += 1
+      #this_actor.info("waiting")
+      ##this_actor.info(self.toString())
+
+      # If node does not get any message for a known period of time, it spontaneously awakes
+      if self.state == NodeState.SLEEPING:
+        self.total_compute_size_in_flops += compute_size_in_flops
+        # Execute procedure wakeup (cause: self-awakened)
+        if self.total_compute_size_in_flops >= self.max_total_compute_size_in_flops:
+          self.trace(Event.SELF_AWAKENED, value = self.total_compute_size_in_flops)
           #this_actor.info(self.toString())
           self.wakeup()
-        self.handleTest(msg)
-
-      elif msg.msg_type == MessageType.REPORT:
-        self.handleReport(msg)
 
-      elif msg.msg_type == MessageType.ACCEPT:
-        self.handleAccept(msg)
+    return async_data.get()
+
+  # Receive the next message by blocking on the mailbox.
+  # While sleeping, the wait is bounded by the time left before self-awakening.
+  def receive_timed(self):
+    result_comm, async_data = self.mailbox.get_async()
+    STATS.activities += 1
+    if self.state == NodeState.SLEEPING:
+      speed = this_actor.get_host().speed
+      start = Engine.clock
+      try:
+        result_comm.wait_for((self.max_total_compute_size_in_flops - self.total_compute_size_in_flops) / speed)
+        self.total_compute_size_in_flops += (Engine.clock - start) * speed
+        return async_data.get()
+      except TimeoutException:
+        # Nothing received for the whole budget: the node spontaneously awakes. The receive stays
+        # posted, a message may already be in transfer on it and would be lost by a new receive
+        self.total_compute_size_in_flops += (Engine.clock - start) * speed
+        self.trace(Event.SELF_AWAKENED, value = self.total_compute_size_in_flops)
+        self.wakeup()
+
+    result_comm.wait()
+    return async_data.get()
 
-      elif msg.msg_type == MessageType.REJECT:
-        self.handleReject(msg)
-
-      elif msg.msg_type == MessageType.CHANGE_ROOT:
-        self.handleChangeRoot(msg)
+  def __call__(self):
+    self.total_compute_size_in_flops = 0 # how many computations did so far while in sleepy state
+    schedule = SCHEDULE.get(self.id)
+    if schedule is None:
+      rng = random.Random(None if RUN_SEED is None else f"{RUN_SEED}:{self.id}")
+      schedule = {"threshold": rng.randint(5, 50), "poll_seed": rng.getrandbits(32)}
+      SCHEDULE[self.id] = schedule
+    self.max_total_compute_size_in_flops = schedule["threshold"] # threshold for self-awakening
+    self.poll_rng = random.Random(schedule["poll_seed"]) # computation steps while polling
+    self.halt = False
+    while not self.halt: # Start asynchronous algorithm
+      if RECEIVE_MODE == "timed":
+        msg = self.receive_timed()
+      else:
+        msg = self.receive_polling()
 
-      elif msg.msg_type == MessageType.TERMINATE:
-        self.handleTerminate(msg)
+      self.dispatch(msg)
+      self.process_deferred_messages()
 
-    this_actor.info(f"[FINISHED with leader {self.leader}] () : {{}}")
+    self.trace(Event.FINISHED, self.leader, value = self.deferred_count)
+    STATS.count_finished(self)
     #this_actor.info(self.toString())
     Comm.wait_all(self.pending_comms)
 
 if __name__ == '__main__':
-  assert len(sys.argv) > 2, f"Usage: python AsynchGHS.py 10-nodes-network.xml 10-nodes-network_d.xml"
-
-  e = Engine(sys.argv)
+  parser = argparse.ArgumentParser(usage = "python AsynchGHS.py 10-nodes-network.xml 10-nodes-network_d.xml [options] [SimGrid options]", allow_abbrev = False)
+  parser.add_argument("platform")
+  parser.add_argument("deployment")
+  parser.add_argument("--receive", choices = ["poll", "timed"], default = RECEIVE_MODE, help = "how nodes wait for messages")
+  parser.add_argument("--trace", choices = TRACE_MODES, default = "text", help = "what is traced, binary writes every event to --trace-file")
+  parser.add_argument("--trace-file", default = "out/trace.bin", help = "binary trace output (render it with ghs_trace.py)")
+  parser.add_argument("--seed", type = int, default = None, help = "run seed, every node derives its wake-up threshold and polling steps from it")
+  parser.add_argument("--record", default = None, help = "write the wake-up schedule of the run to this JSON file")
+  parser.add_argument("--replay", default = None, help = "replay the wake-up schedule of a JSON file written by --record")
+  parser.add_argument("--stats", default = None, help = "write a JSON summary of the message counters to this file")
+  args, simgrid_args = parser.parse_known_args()
+  RECEIVE_MODE = args.receive
+  RUN_SEED = args.seed
+  if args.replay:
+    with open(args.replay, 'r') as file:
+      SCHEDULE = {int(node): schedule for node, schedule in json.load(file)["nodes"].items()}
+  TRACE = TraceSink(args.trace, args.trace_file, log = this_actor.info, clock = lambda: Engine.clock)
+
+  e = Engine([sys.argv[0]] + simgrid_args)
 
   # Register the classes representing the actors
   e.register_actor("node", Node)
 
   # Load the platform description and then deploy the application
-  e.load_platform(sys.argv[1]) 
-  e.load_deployment(sys.argv[2])
+  e.load_platform(args.platform)
+  e.load_deployment(args.deployment)
 
   # Run the simulation
   e.run()
+  TRACE.close()
+  if args.record:
+    with open(args.record, 'w') as file:
+      json.dump({"seed": RUN_SEED, "nodes": {str(node): SCHEDULE[node] for node in sorted(SCHEDULE)}}, file, indent = 2)
+  if args.stats:
+    with open(args.stats, 'w') as file:
+      json.dump(STATS.summary(), file, indent = 2)
   #e.run_until(Engine.clock + 2000)
   this_actor.info("Simulation is over")
\ No newline at end of file
@@ -0,0 +1,106 @@
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+
+import generate_network
+import verify_mst
+
+# Runs AsynchGHS.py over a matrix of generated topologies and sizes, and writes one row per run:
+# wall-clock time, peak RSS, simulated activities, message counts and simulated completion time.
+#
+#   python benchmark.py --families ring grid sparse --sizes 16 64 256
+
+# Graph families, as arguments of generate_network.py for n nodes
+FAMILIES = {
+    "ring": lambda n: ["ring", str(n)],
+    "grid": lambda n: ["grid", str(n)],
+    "star": lambda n: ["star", str(n)],
+    "complete": lambda n: ["complete", str(n)],
+    "sparse": lambda n: ["gnp", str(n), "--p", str(min(1.0, 4 / n))],
+    "dense": lambda n: ["gnp", str(n), "--p", "0.5"],
+    "scale-free": lambda n: ["scale-free", str(n), "--m", "2"],
+}
+
+COLUMNS = ["family", "nodes", "edges", "status", "wall_time", "peak_rss_mb", "activities", "messages",
+           "message_bound", "bytes", "deferred", "max_level", "completion_time", "verified"]
+
+def generate_scenario(family, n, workdir, seed = 0):
+    args = generate_network.build_parser().parse_args(
+        FAMILIES[family](n) + ["-o", os.path.join(workdir, f"{family}-{n}-{seed}"), "--seed", str(seed)])
+    platform, deployment, edges = generate_network.generate(args)
+    return platform, deployment
+
+def run_simulation(platform, deployment, stats_path, options = (), timeout = None, verify = False):
+    # Runs one simulation in a child process. Returns its status, wall-clock time, peak RSS
+    # and the counters it dumped with --stats. With verify, the run writes a binary trace that
+    # is checked by verify_mst.py, then removed.
+    trace_path = stats_path.replace(".stats.json", "") + ".trace.bin"
+    trace_options = ["--trace=binary", f"--trace-file={trace_path}"] if verify else ["--trace=off"]
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "AsynchGHS.py"),
+               platform, deployment] + trace_options + [f"--stats={stats_path}"] + list(options)
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    status = "ok"
+    while True:
+        pid, exit_status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid != 0:
+            break
+        if timeout is not None and time.perf_counter() - start > timeout:
+            process.kill()
+            pid, exit_status, rusage = os.wait4(process.pid, 0)
+            status = "timeout"
+            break
+        time.sleep(0.01)
+    wall_time = time.perf_counter() - start
+    if status == "ok" and os.waitstatus_to_exitcode(exit_status) != 0:
+        status = "error"
+
+    result = {"status": status, "wall_time": round(wall_time, 3), "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1)}
+    if status == "ok":
+        with open(stats_path, 'r') as file:
+            result.update(json.load(file))
+        if verify:
+            ok, report = verify_mst.verify(verify_mst.deployment_edges(deployment), trace_path)
+            result["verified"] = "pass" if ok else "fail"
+    if verify and os.path.exists(trace_path):
+        os.remove(trace_path)
+    return result
+
+def print_table(rows):
+    widths = [max(len(column), *(len(str(row.get(column, ""))) for row in rows)) for column in COLUMNS]
+    print("  ".join(column.rjust(width) for column, width in zip(COLUMNS, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).rjust(width) for column, width in zip(COLUMNS, widths)))
+
+def write_csv(rows, path):
+    with open(path, 'w', newline = '') as file:
+        writer = csv.DictWriter(file, fieldnames = COLUMNS, extrasaction = 'ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Benchmark AsynchGHS.py over generated topologies")
+    parser.add_argument("--families", nargs = "+", choices = list(FAMILIES), default = list(FAMILIES))
+    parser.add_argument("--sizes", nargs = "+", type = int, default = [16, 64, 256])
+    parser.add_argument("--workdir", default = "out/benchmark", help = "where scenarios and run counters are written")
+    parser.add_argument("--output", default = "out/benchmark.csv", help = "results table")
+    parser.add_argument("--timeout", type = float, default = 600, help = "seconds before a run is killed")
+    parser.add_argument("--verify", action = "store_true", help = "check the MST and leader of every run (traces the runs, which adds to their time)")
+    args, options = parser.parse_known_args()  # unknown options are passed to AsynchGHS.py
+
+    rows = []
+    for family in args.families:
+        for n in args.sizes:
+            platform, deployment = generate_scenario(family, n, args.workdir)
+            stats_path = os.path.join(args.workdir, f"{family}-{n}.stats.json")
+            row = {"family": family, "nodes": n}
+            row.update(run_simulation(platform, deployment, stats_path, options, args.timeout, args.verify))
+            rows.append(row)
+            print(f"{family} {n}: {row['status']} in {row['wall_time']}s", file = sys.stderr)
+
+    print_table(rows)
+    write_csv(rows, args.output)
@@ -0,0 +1,219 @@
+import argparse
+import math
+import os
+import random
+from array import array
+
+from ghs_graph import read_edge_list
+
+# Generates the SimGrid platform (<prefix>.xml), the deployment (<prefix>_d.xml) and the
+# shared edge list (<prefix>.txt, same format as in/graph.txt) of a GHS scenario.
+# Everything is streamed: edges are written once to the edge list, which is then re-read
+# to emit links and routes, and the deployment only references the edge list.
+#
+#   python generate_network.py ring 1000 -o in/ring-1000
+#   python generate_network.py gnp 10000 --p 0.001 --seed 7 -o in/gnp-10000
+#   python generate_network.py edges in/graph.txt -o in/10-nodes
+
+def ring_edges(n, args, rng):
+    for u in range(n - 1):
+        yield u, u + 1
+    if n > 2:
+        yield 0, n - 1
+
+def grid_edges(n, args, rng):
+    cols = args.cols or max(1, math.isqrt(n))
+    for u in range(n):
+        if (u + 1) % cols != 0 and u + 1 < n:
+            yield u, u + 1
+        if u + cols < n:
+            yield u, u + cols
+
+def star_edges(n, args, rng):
+    for u in range(1, n):
+        yield 0, u
+
+def complete_edges(n, args, rng):
+    for u in range(n):
+        for v in range(u + 1, n):
+            yield u, v
+
+def gnp_edges(n, args, rng):
+    # G(n,p) laid over the path 0-1-...-(n-1) so that the graph is always connected.
+    # Pairs (w, v), w < v, are sampled with geometric skips (Batagelj & Brandes),
+    # which is linear in the number of edges instead of quadratic in n.
+    for u in range(n - 1):
+        yield u, u + 1
+    p = args.p
+    if p <= 0:
+        return
+    log_q = math.log(1 - p) if p < 1 else None
+    v, w = 1, -1
+    while v < n:
+        if log_q is None:
+            w += 1
+        else:
+            w += 1 + int(math.log(1 - rng.random()) / log_q)
+        while w >= v and v < n:
+            w -= v
+            v += 1
+        if v < n and w != v - 1:
+            yield w, v
+
+def scale_free_edges(n, args, rng):
+    # Barabasi-Albert preferential attachment: a clique of m + 1 nodes, then every new
+    # node attaches to m distinct nodes picked proportionally to their degree.
+    m = max(1, min(args.m, n - 1))
+    clique = min(m + 1, n)
+    endpoints = array('i')
+    for u in range(clique):
+        for v in range(u + 1, clique):
+            endpoints.append(u)
+            endpoints.append(v)
+            yield u, v
+    for v in range(m + 1, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(endpoints[rng.randrange(len(endpoints))])
+        for u in sorted(targets):
+            endpoints.append(u)
+            endpoints.append(v)
+            yield u, v
+
+MODELS = {
+    "ring": ring_edges,
+    "grid": grid_edges,
+    "star": star_edges,
+    "complete": complete_edges,
+    "gnp": gnp_edges,
+    "scale-free": scale_free_edges,
+}
+
+def is_prime(n):
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def distinct_weights(count, rng):
+    # Yields a pseudo-random permutation of 1..count in O(1) memory: an affine map modulo
+    # a prime P >= count, cycle-walking over the values that fall outside [0, count).
+    prime = max(count, 2)
+    while not is_prime(prime):
+        prime += 1
+    a = rng.randrange(1, prime)
+    c = rng.randrange(prime)
+    for i in range(count):
+        x = i
+        while True:
+            x = (a * x + c) % prime
+            if x < count:
+                break
+        yield x + 1
+
+def write_edge_list(args, edges_path):
+    # Returns the number of nodes of the written graph
+    if args.model == "edges":
+        n = 0
+        with open(edges_path, 'w') as out:
+            for u, v, weight in read_edge_list(args.size, parse = str):
+                n = max(n, u + 1, v + 1)
+                out.write(f"{u} {v} {weight}\n")
+        return n
+
+    n = int(args.size)
+    generate = MODELS[args.model]
+    # First pass only counts the edges, the second one (same seed) assigns them weights
+    count = sum(1 for _ in generate(n, args, random.Random(args.seed)))
+    weights = distinct_weights(count, random.Random(args.seed + 1))
+    with open(edges_path, 'w') as out:
+        for (u, v), weight in zip(generate(n, args, random.Random(args.seed)), weights):
+            out.write(f"{u} {v} {weight}\n")
+    return n
+
+def bandwidth(weight):
+    # Links mirror the edge weights, as in in/10-nodes-network.xml, unless a weight is not a valid bandwidth
+    try:
+        if float(weight) > 0:
+            return weight
+    except ValueError:
+        pass
+    return "1"
+
+def write_platform(n, edges_path, platform_path, routing):
+    with open(platform_path, 'w') as out:
+        out.write("<?xml version='1.0'?>\n")
+        out.write('<!DOCTYPE platform SYSTEM "https://simgrid.org/simgrid.dtd">\n')
+        out.write('<platform version="4.1">\n')
+        out.write(f'  <zone id="zone0" routing="{routing}">\n')
+        for u in range(n):
+            out.write(f'    <host id="host{u}" speed="1f"/>\n')
+        out.write("\n")
+        for u, v, weight in read_edge_list(edges_path, parse = str):
+            out.write(f'    <link id="link{u}-{v}" bandwidth="{bandwidth(weight)}Bps" latency="0"/>\n')
+        out.write("\n")
+        for u, v, weight in read_edge_list(edges_path, parse = str):
+            out.write(f'    <route src="host{u}" dst="host{v}"><link_ctn id="link{u}-{v}"/></route>\n')
+        out.write("  </zone>\n")
+        out.write("</platform>\n")
+
+def write_deployment(n, edges_path, deployment_path):
+    with open(deployment_path, 'w') as out:
+        out.write("<?xml version='1.0'?>\n")
+        out.write('<!DOCTYPE platform SYSTEM "https://simgrid.org/simgrid.dtd">\n')
+        out.write('<platform version="4.1">\n')
+        for u in range(n):
+            out.write(f'\n  <actor host="host{u}" function="node">\n')
+            out.write(f'     <argument value="{u}"/>\n')
+            out.write(f'     <argument value="@{edges_path}"/>\n')
+            out.write('  </actor>\n')
+        out.write("\n</platform>\n")
+
+def generate(args):
+    # Returns the (platform, deployment, edge list) paths of the generated scenario
+    platform_path = args.output + ".xml"
+    deployment_path = args.output + "_d.xml"
+    edges_path = args.output + ".txt"
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+
+    n = write_edge_list(args, edges_path)
+    write_platform(n, edges_path, platform_path, args.routing)
+    write_deployment(n, edges_path, deployment_path)
+    return platform_path, deployment_path, edges_path
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate SimGrid platform and deployment files for AsynchGHS.py")
+    parser.add_argument("model", choices=["edges"] + list(MODELS), help="graph model, or 'edges' to read an existing edge list")
+    parser.add_argument("size", help="number of nodes, or the edge list file for the 'edges' model")
+    parser.add_argument("-o", "--output", required=True, help="output prefix, writes <prefix>.xml, <prefix>_d.xml and <prefix>.txt")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the graph and of its weights")
+    parser.add_argument("--p", type=float, default=0.01, help="edge probability of the gnp model")
+    parser.add_argument("--m", type=int, default=2, help="edges added per node by the scale-free model")
+    parser.add_argument("--cols", type=int, default=0, help="columns of the grid model (default: sqrt(n))")
+    parser.add_argument("--routing", default="Dijkstra",
+                        help="routing of the SimGrid zone; Full keeps an N x N route table, only for small N")
+    return parser
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    if args.model == "edges" and os.path.abspath(args.size) == os.path.abspath(args.output + ".txt"):
+        raise SystemExit("The input edge list would be overwritten, choose another output prefix")
+    for path in generate(args):
+        print(path)
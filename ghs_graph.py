@@ -0,0 +1,53 @@
+# Graph inputs of a GHS run, read the same way by AsynchGHS.py, generate_network.py, verify_mst.py
+# and plot_graph_evolution.py: the "src dst weight" edge lists (such as in/graph.txt) and the
+# neighbour lists given to the nodes as deployment arguments.
+
+def parse_weight(text):
+    # Weights are kept as integers when they are integers (exact for 64-bit values), floats otherwise
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def read_edge_list(path, parse = parse_weight):
+    # Yields (u, v, weight) of a "src dst weight" edge list such as in/graph.txt, weight parsed by parse
+    with open(path, 'r') as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) >= 3:
+                yield int(fields[0]), int(fields[1]), parse(fields[2])
+
+# Neighbour lists of the edge lists referenced by "@<edge file>" deployment arguments, each file is
+# read once, and a list is dropped when its node takes it. A file whose lists were all taken is
+# read again by the next deployment that references it
+edge_lists = {}
+
+def parse_links(node, links):
+    # (neighbour, weight) pairs of the deployment argument of a node, in one of three formats:
+    #   "@<edge file>": the edges of the node in a shared "src dst weight" edge list
+    #   "dst:weight dst:weight ...": sparse neighbour list
+    #   "w0 w1 ... wN-1": dense adjacency row, 0 meaning no edge
+    if links.startswith("@"):
+        path = links[1:]
+        if path not in edge_lists:
+            adjacency = {}
+            for u, v, weight in read_edge_list(path):
+                adjacency.setdefault(u, []).append((v, weight))
+                adjacency.setdefault(v, []).append((u, weight))
+            edge_lists[path] = adjacency
+        neighbours = edge_lists[path].pop(node, [])
+        if not edge_lists[path]:
+            del edge_lists[path]
+        return neighbours
+    if ":" in links:
+        neighbours = []
+        for pair in links.split():
+            neighbour, weight = pair.split(":")
+            neighbours.append((int(neighbour), parse_weight(weight)))
+        return neighbours
+    neighbours = []
+    for neighbour, weight in enumerate(links.split()):
+        weight = parse_weight(weight)
+        if weight > 0:
+            neighbours.append((neighbour, weight))
+    return neighbours
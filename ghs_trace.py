@@ -0,0 +1,260 @@
+import re
+import struct
+import sys
+from collections import namedtuple
+from enum import IntEnum
+
+# Trace of a GHS run. Every event of a node is one fixed-size binary record:
+#   (timestamp, node, event, message type, peer, level, weight, low, high, value)
+# so a trace can be written without formatting any text, loaded as columns
+# (e.g. numpy.fromfile with RECORD_DTYPE) or rendered as the human text log.
+# (weight, low, high) is the edge key carried by the message: the fragment id of an Initiate or a
+# Test, the best weight of a Report. low and high are the end nodes of the edge, -1 for no key or
+# for the infinite weight. weight is a float64, the nodes tell a key apart from the other keys of
+# equal weight, or of weights rounded to the same float64
+# read_events streams the events of either a binary trace or a text log, and scan_events
+# also gives the offset of every event, to resume reading from there later.
+#
+#   python ghs_trace.py out/trace.bin > out/log_file.log
+
+class Event(IntEnum):
+    SELF_AWAKENED = 0   # value: flops done while sleeping
+    AWAKENED = 1        # peer: node that woke us up, value: flops done while sleeping
+    BRANCH = 2          # peer: other end of the edge
+    REJECTED = 3        # peer: other end of the edge
+    SEND = 4            # peer: destination, message fields in level, key and value
+    RECEIVE = 5         # peer: source, message fields in level, key and value
+    DEFER = 6           # peer: source of the message placed at the end of the queue
+    FINISHED = 7        # peer: leader, value: deferred messages
+
+TraceEvent = namedtuple("TraceEvent", ["timestamp", "node", "event", "msg_type", "peer", "level", "weight", "low", "high", "value"])
+
+MAGIC = b"GHSTRACE\x02"
+RECORD = struct.Struct("<diBbiidiid")
+RECORD_DTYPE = [("timestamp", "<f8"), ("node", "<i4"), ("event", "u1"), ("msg_type", "i1"), ("peer", "<i4"),
+                ("level", "<i4"), ("weight", "<f8"), ("low", "<i4"), ("high", "<i4"), ("value", "<f8")]
+
+# Names used by the text log, indexed by the values of AsynchGHS.MessageType and AsynchGHS.NodeState
+MESSAGE_NAMES = ["CONNECT", "INITIATE", "TEST", "REPORT", "ACCEPT", "REJECT", "CHANGE_ROOT", "TERMINATE"]
+ARROW_NAMES = ["Connect", "Initiate", "Test", "Report", "Accept", "Reject", "Change Root", "Terminate"]
+NODE_STATE_NAMES = ["SLEEPING", "FIND", "FOUND"]
+
+MODES = ["off", "summary", "text", "verbose", "binary"]
+
+def number(x):
+    if isinstance(x, float) and x.is_integer():
+        return int(x)
+    return x
+
+def edge_key(weight, low, high):
+    # Key of a trace event as the tuple sent by the node: (weight, low, high), or (weight,) for INF
+    if low == -1:
+        return (number(weight),)
+    return (number(weight), low, high)
+
+def split_key(key):
+    # (weight, low, high) columns of a key tuple, None being no key
+    if key is None:
+        return -1.0, -1, -1
+    if len(key) == 1:
+        return key[0], -1, -1
+    return key
+
+def render_payload(msg_type, level, key, value):
+    name = MESSAGE_NAMES[msg_type]
+    if name == "CONNECT":
+        return f"Level = {level}"
+    if name == "INITIATE":
+        return f"Level = {level}, Fragment id = {key}, State = NodeState.{NODE_STATE_NAMES[int(value)]}"
+    if name == "TEST":
+        return f"Level = {level}, Fragment id = {key}"
+    if name == "REPORT":
+        return f"Best weight = {key}"
+    if name == "TERMINATE":
+        return f"Leader = {number(value)}"
+    return ""
+
+# Tag of one event, the first bracket of its text log message
+def render_tag(event, msg_type, peer):
+    if event == Event.SELF_AWAKENED:
+        return "SELF-AWAKENED"
+    if event == Event.AWAKENED:
+        return f"AWAKENED by {peer}"
+    if event == Event.BRANCH:
+        return f"BRANCH to {peer}"
+    if event == Event.REJECTED:
+        return f"REJECTED to {peer}"
+    if event == Event.SEND:
+        return f"{MESSAGE_NAMES[msg_type]} to {peer}"
+    if event == Event.RECEIVE:
+        return f"{MESSAGE_NAMES[msg_type]} from {peer}"
+    if event == Event.DEFER:
+        return f"Place received {MESSAGE_NAMES[msg_type]} message from {peer} at the end of queue!"
+    return f"FINISHED with leader {peer}"
+
+# Message of one event, as printed by the text log after the "[time] [host]" prefix
+def render_message(node, event, msg_type, peer, level, key, value):
+    tag = render_tag(event, msg_type, peer)
+    if event in (Event.SELF_AWAKENED, Event.AWAKENED):
+        return f"[{tag}] (Did {number(value)} flops) : {{}}"
+    if event == Event.SEND:
+        return f"[{tag}] ({node} -- {ARROW_NAMES[msg_type]} --> {peer}) : {{{render_payload(msg_type, level, key, value)}}}"
+    if event == Event.RECEIVE:
+        return f"[{tag}] ({node} <-- {ARROW_NAMES[msg_type]} -- {peer}) : {{{render_payload(msg_type, level, key, value)}}}"
+    if event == Event.FINISHED:
+        return f"[{tag}] () : {{Deferred messages = {number(value)}}}"
+    return f"[{tag}] () : {{}}"
+
+def render_line(e):
+    return f"[{e.timestamp:.6f}] [host{e.node}] " + render_message(e.node, e.event, e.msg_type, e.peer, e.level, edge_key(e.weight, e.low, e.high), e.value)
+
+# Destination of the events of a run. off: nothing, summary: only the FINISHED line of every node,
+# text: every event in the simulation log, verbose: text plus node state dumps, binary: every event
+# to a trace file, buffered so that the simulation does not write per event
+class TraceSink:
+    def __init__(self, mode = "text", path = None, log = print, clock = None, buffer_size = 4096):
+        self.mode = mode
+        self.verbose = mode == "verbose"
+        self.log = log
+        self.clock = clock
+        self.file = None
+        self.buffer = []
+        self.buffer_size = buffer_size
+        if mode == "binary":
+            self.file = open(path, 'wb')
+            self.file.write(MAGIC)
+
+    def records(self, event):
+        if self.mode == "off":
+            return False
+        if self.mode == "summary":
+            return event == Event.FINISHED
+        return True
+
+    def record(self, node, event, peer = -1, msg_type = -1, level = -1, key = None, value = 0):
+        if self.file is None:
+            self.log(render_message(node, event, msg_type, peer, level, key, value))
+            return
+        self.buffer.append(RECORD.pack(self.clock(), node, event, msg_type, peer, level, *split_key(key), value))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.write(b"".join(self.buffer))
+            self.buffer = []
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+def read_trace(path, offset = None):
+    # Yields the TraceEvent of a binary trace, one record at a time, starting at the record at offset
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a GHS binary trace")
+        if offset is not None:
+            file.seek(offset)
+        while True:
+            chunk = file.read(RECORD.size * 4096)
+            if not chunk:
+                break
+            for fields in RECORD.iter_unpack(chunk):
+                yield TraceEvent(*fields)
+
+# Text log lines, compiled once: "[time] [hostN] [tag] (details) : {payload}"
+LINE_PATTERN = re.compile(r"\[(\d+\.\d+)\] \[host(\d+)\] \[(.*?)\] \((.*)\) : \{(.*)\}$")
+FLOPS_PATTERN = re.compile(r"Did ([^ ,]+) flops")
+FIELD_PATTERN = re.compile(r"(\w[\w ]*?) = (\([^)]*\)|[^,]+)")
+MESSAGE_TYPES = {name: msg_type for msg_type, name in enumerate(MESSAGE_NAMES)}
+NODE_STATES = {f"NodeState.{name}": state for state, name in enumerate(NODE_STATE_NAMES)}
+
+def parse_line(line):
+    # Returns the TraceEvent of a text log line, or None if the line is not a node event
+    match = LINE_PATTERN.match(line)
+    if match is None:
+        return None
+    timestamp, node, tag, details, payload = match.groups()
+    words = tag.split(" ")
+    msg_type, peer, level, weight, low, high, value = -1, -1, -1, -1.0, -1, -1, 0.0
+    if words[0] == "SELF-AWAKENED":
+        event = Event.SELF_AWAKENED
+    elif words[0] == "AWAKENED":
+        event, peer = Event.AWAKENED, int(words[2])
+    elif words[0] == "BRANCH":
+        event, peer = Event.BRANCH, int(words[2])
+    elif words[0] == "REJECTED":
+        event, peer = Event.REJECTED, int(words[2])
+    elif words[0] == "FINISHED":
+        event, peer = Event.FINISHED, int(words[3])
+    elif words[0] == "Place":
+        event, msg_type, peer = Event.DEFER, MESSAGE_TYPES[words[2]], int(words[5])
+    elif words[0] in MESSAGE_TYPES and len(words) == 3:
+        event = Event.SEND if words[1] == "to" else Event.RECEIVE
+        msg_type, peer = MESSAGE_TYPES[words[0]], int(words[2])
+    else:
+        return None
+
+    if event in (Event.SELF_AWAKENED, Event.AWAKENED):
+        flops = FLOPS_PATTERN.match(details)
+        if flops:
+            value = float(flops.group(1))
+    for name, field in FIELD_PATTERN.findall(payload):
+        if name == "Level":
+            level = int(field)
+        elif name in ("Fragment id", "Best weight"):
+            key = [part.strip() for part in field.strip("()").split(",") if part.strip()]
+            weight = float(key[0])
+            if len(key) == 3:
+                low, high = int(key[1]), int(key[2])
+        elif name == "State":
+            value = float(NODE_STATES[field])
+        else:  # Leader or Deferred messages
+            value = float(field)
+    return TraceEvent(float(timestamp), int(node), event, msg_type, peer, level, weight, low, high, value)
+
+def scan_log(path, offset = None):
+    # Yields (offset, TraceEvent) for the lines of a text log, starting at the line at offset.
+    # The text log does not print the fields of deferred messages, so DEFER events only have
+    # their type and source
+    with open(path, 'rb') as file:
+        if offset is not None:
+            file.seek(offset)
+        position = file.tell()
+        for line in file:
+            e = parse_line(line.decode(errors = 'replace'))
+            if e is not None:
+                yield position, e
+            position += len(line)
+
+def read_log(path, offset = None):
+    # Yields the TraceEvent of a text log, one line at a time
+    for _, e in scan_log(path, offset):
+        yield e
+
+def is_binary(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+def read_events(path, offset = None):
+    # Yields the TraceEvent of a binary trace or of a text log, whichever the file is,
+    # from the event at offset (as given by scan_events) or from the first one
+    return read_trace(path, offset) if is_binary(path) else read_log(path, offset)
+
+def scan_events(path, offset = None):
+    # Yields (offset, TraceEvent) of a binary trace or of a text log, offset being where the event
+    # starts in the file
+    if not is_binary(path):
+        yield from scan_log(path, offset)
+        return
+    position = len(MAGIC) if offset is None else offset
+    for e in read_trace(path, offset):
+        yield position, e
+        position += RECORD.size
+
+if __name__ == '__main__':
+    assert len(sys.argv) > 1, f"Usage: python ghs_trace.py out/trace.bin"
+    for e in read_trace(sys.argv[1]):
+        print(render_line(e))
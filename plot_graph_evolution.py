@@ -1,9 +1,19 @@
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 from matplotlib.animation import FuncAnimation
+from matplotlib.colors import hsv_to_rgb, to_rgba
+import argparse
+import bisect
+import hashlib
+import os
 import pickle
-import re
-from enum import Enum
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum, IntEnum
+
+from ghs_graph import read_edge_list
+from ghs_trace import Event, MESSAGE_NAMES, edge_key, read_events, render_tag, scan_events
 
 class Color(Enum):
     SLEEP = "#808080"
@@ -16,289 +26,456 @@ class Color(Enum):
     EDGE_CORE = "#FFFF00"
     EDGE_REJECTED_ONE_SIDE = "#DCDCDC"
     EDGE_REJECTED_TWO_SIDES = "#F5F5F5"
-    F_1 = "#F51313"
-    F_2 = "#0000FF"
-    F_3 = "#00FFFF"
-    F_4 = "#FF00FF"
-    F_5 = "#800000"
-    F_6 = "#808000"
-    F_7 = "#008080"
-    F_8 = "#800080"
-    F_9 = "#00008"
-    F_10 = "#FFFACD"
-
-fragmentOfNode = {}
-
-fragmentColor = {
-    "-1": Color.SLEEP.value,
-    "0": Color.F_0.value
-}
+
+class EdgeState(IntEnum):
+    OFF = 0
+    BRANCH_ONE_SIDE = 1
+    BRANCH_TWO_SIDES = 2
+    CORE = 3
+    REJECTED_ONE_SIDE = 4
+    REJECTED_TWO_SIDES = 5
+
+# RGBA of every EdgeState
+EDGE_COLORS = np.array([to_rgba(color.value) for color in (Color.EDGE_OFF, Color.EDGE_BRANCH_ONE_SIDE, Color.EDGE_BRANCH_TWO_SIDES,
+                                                          Color.EDGE_CORE, Color.EDGE_REJECTED_ONE_SIDE, Color.EDGE_REJECTED_TWO_SIDES)])
+
+# Palette indices of the nodes that are not in a named fragment yet
+SLEEPING = 0
+AWAKE = 1
+
+# Graph, every node and edge is addressed by its index in the arrays below
+nodes = []          # node ids, in drawing order
+nodeIndex = {}      # node id -> node index
+edges = []          # (u, v) with u < v, in drawing order
+edgeIndex = {}      # (u, v) with u < v -> edge index
+edgeWeight = None   # weight per edge
+
+# State of the run after the events applied so far
+nodeColorIndex = None   # palette index per node
+nodeFragment = None     # fragment id (key of its core edge) per node, None until its first Initiate
+nodeLevel = None        # level per node
+nodeLeader = None       # leader per node, -1 until it finishes
+edgeState = None        # EdgeState per edge
+coreEdges = set()       # edges currently in the CORE state
+fragmentIndex = {}      # fragment id (key of its core edge) -> palette index
+palette = []            # RGBA per palette index, grows with the fragments
 maxFragmentLevel = 0
-edgeColor = {}
-edgeWeight = {}
-
-fragmentCount = 0
-
-nodeLeader = {}
-
-def extract_vars(line):
-    # [128.000000] [host2] [INITIATE from 3] (2 <-- Initiate -- 3) : {Level = 1, Fragment id = 4, State = NodeState.FIND}"
-    pattern = r"\[(\d+\.\d+)\] \[host(\d+)\] \[(.*?)\] \(.*\) \: \{(.*)\}"
-    match = re.match(pattern, line)
-    if match:
-        timestamp = float(match.group(1))
-        id = int(match.group(2))
-        message = match.group(3)
-        payload = match.group(4)
-        return (timestamp, id, message, payload)
-    else:
-        return None
 
-def read_log_file(log_file):
-    graph_states = []
-    with open(log_file, 'r') as file:
-        for line in file:
-            extracted_tuple = extract_vars(line)
-            if extracted_tuple is not None: 
-                graph_states.append(extracted_tuple)
-                #print(f"Timestamp: {extracted_tuple[0]}, id: {extracted_tuple[1]}, message: {extracted_tuple[2]}, payload: {extracted_tuple[3]}")
-    return graph_states
-
-def load_graph(file_path):
+# Events applied without being drawn, their nodes and edges are redrawn by the next frame
+dirtyNodes = set()
+dirtyEdges = set()
+
+def fragment_color(k):
+    # Colour of the k-th fragment: hues spread by the golden ratio, so that fragments created one
+    # after the other stay far apart, on two alternating brightness levels
+    hue = (k * 0.618033988749895) % 1.0
+    return tuple(hsv_to_rgb((hue, 0.9, 0.95 if k % 2 else 0.65))) + (1.0,)
+
+def edge_id(u, v):
+    return edgeIndex[(u, v) if u < v else (v, u)]
+
+def reset_state():
+    global nodeColorIndex, nodeFragment, nodeLevel, nodeLeader, edgeState, maxFragmentLevel
+    nodeColorIndex = np.full(len(nodes), SLEEPING, dtype=np.int32)
+    nodeFragment = np.full(len(nodes), None, dtype=object)
+    nodeLevel = np.zeros(len(nodes), dtype=np.int32)
+    nodeLeader = np.full(len(nodes), -1, dtype=np.int64)
+    edgeState = np.full(len(edges), EdgeState.OFF, dtype=np.int8)
+    coreEdges.clear()
+    fragmentIndex.clear()
+    palette[:] = [to_rgba(Color.SLEEP.value), to_rgba(Color.F_0.value)]
+    maxFragmentLevel = 0
+    dirtyNodes.clear()
+    dirtyEdges.clear()
+
+def snapshot():
+    # Full state of the run, as stored in the keyframes
+    return {"nodeColorIndex": nodeColorIndex.copy(), "nodeFragment": nodeFragment.copy(), "nodeLevel": nodeLevel.copy(),
+            "nodeLeader": nodeLeader.copy(), "edgeState": edgeState.copy(), "coreEdges": set(coreEdges),
+            "fragmentIndex": dict(fragmentIndex), "maxFragmentLevel": maxFragmentLevel}
+
+def restore(state):
+    global nodeColorIndex, nodeFragment, nodeLevel, nodeLeader, edgeState, maxFragmentLevel
+    reset_state()
+    nodeColorIndex = state["nodeColorIndex"].copy()
+    nodeFragment = state["nodeFragment"].copy()
+    nodeLevel = state["nodeLevel"].copy()
+    nodeLeader = state["nodeLeader"].copy()
+    edgeState = state["edgeState"].copy()
+    coreEdges.update(state["coreEdges"])
+    fragmentIndex.update(state["fragmentIndex"])
+    palette.extend(fragment_color(k) for k in range(1, len(fragmentIndex) + 1))
+    maxFragmentLevel = state["maxFragmentLevel"]
+
+# Layouts of the graph. spring is the force-directed layout of the original plots, it is quadratic in
+# the number of nodes. spectral (which needs scipy from 500 nodes) and bfs (linear, nodes placed in
+# the BFS layers from the smallest node) scale to large graphs. auto picks spring up to LARGE_GRAPH_NODES
+LAYOUTS = {
+    "spring": lambda G: nx.spring_layout(G, seed = 100),
+    "spectral": lambda G: nx.spectral_layout(G),
+    "bfs": lambda G: nx.bfs_layout(G, min(G)),
+}
+LARGE_GRAPH_NODES = 1000
+LAYOUT_CACHE = "out/layout_cache"
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def graph_layout(G, file_path, layout = "auto", cache_dir = LAYOUT_CACHE):
+    # Positions of the nodes, cached in cache_dir by hash of the edge list and layout
+    if layout == "auto":
+        layout = "spring" if G.number_of_nodes() <= LARGE_GRAPH_NODES else "spectral"
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, f"{file_hash(file_path)}.{layout}.pkl")
+        try:
+            with open(cache_file, 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    pos = LAYOUTS[layout](G)
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'wb') as file:
+            pickle.dump(pos, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return pos
+
+def load_graph(file_path, pos = None, layout = "auto", cache_dir = LAYOUT_CACHE):
+    global edgeWeight
     # Create an empty graph
     G = nx.Graph()
 
-    nodes = []
-    edges = []
-    # Read the file
-    with open(file_path, 'r') as file:
-        for line in file:
-            # Parse the line into node1, node2, and weight
-            node1, node2, weight = map(int, line.split())
-            nodes.append(node1)
-            nodes.append(node2)
-
-            # Add an edge with the specified weight
-            G.add_edge(node1, node2, weight=weight)
-
-            global edgeColor
-            global edgeWeight
-            if node1 < node2:
-                edgeColor[str(node1) + str(node2)] = Color.EDGE_OFF.value
-                edgeWeight[str(node1) + str(node2)] = weight
-            else:
-                edgeColor[str(node2) + str(node1)] = Color.EDGE_OFF.value
-                edgeWeight[str(node2) + str(node1)] = weight
+    # Read the file, and add every edge with its weight
+    for node1, node2, weight in read_edge_list(file_path):
+        G.add_edge(node1, node2, weight=weight)
 
+    nodes[:] = sorted(G.nodes())
+    nodeIndex.clear()
+    for i, node in enumerate(nodes):
+        nodeIndex[node] = i
+    edges[:] = [(min(u, v), max(u, v)) for u, v in G.edges()]
+    edgeIndex.clear()
+    for i, edge in enumerate(edges):
+        edgeIndex[edge] = i
+    edgeWeight = np.array([G[u][v]["weight"] for u, v in edges], dtype=float)
+    reset_state()
 
-    nodes = list(set(nodes))
+    if pos is None:
+        pos = graph_layout(G, file_path, layout, cache_dir)
 
-    global fragmentOfNode
-    global nodeLeader
-    for node in nodes:
-        fragmentOfNode[str(node)] = -1
-        nodeLeader[str(node)] = -1
+    return G, pos, nodes
 
-    pos = nx.spring_layout(G, seed = 100)
+def apply_event(e):
+    # Applies one event to the state arrays, returns the indices of the edges whose state changed
+    global maxFragmentLevel
+    i = nodeIndex[e.node]
+    changed = []
+
+    if e.event == Event.SELF_AWAKENED or e.event == Event.AWAKENED:
+        nodeColorIndex[i] = AWAKE
+    elif e.event == Event.RECEIVE and MESSAGE_NAMES[e.msg_type] == "INITIATE":
+        #[128.000000] [host2] [INITIATE from 3] (2 <-- Initiate -- 3) : {Level = 1, Fragment id = (4, 2, 3), State = NodeState.FIND}
+        newLevel = e.level > maxFragmentLevel
+        maxFragmentLevel = max(maxFragmentLevel, e.level)
+
+        fragment = edge_key(e.weight, e.low, e.high)
+        if fragment not in fragmentIndex:
+            fragmentIndex[fragment] = len(palette)
+            palette.append(fragment_color(len(palette) - AWAKE))
+        nodeColorIndex[i] = fragmentIndex[fragment]
+        nodeFragment[i] = fragment
+        nodeLevel[i] = e.level
+
+        # Initiate received on the edge named after the fragment: it is the core of the fragment.
+        # Logs without the end nodes of the key only name the fragment by the weight of its core
+        j = edge_id(e.node, e.peer)
+        isCore = edges[j] == (e.low, e.high) if e.low != -1 else edgeWeight[j] == e.weight
+        if isCore:
+            if newLevel:
+                # The cores of the previous levels are now plain Branch edges
+                for core in coreEdges:
+                    edgeState[core] = EdgeState.BRANCH_TWO_SIDES
+                changed.extend(coreEdges)
+                coreEdges.clear()
+            edgeState[j] = EdgeState.CORE
+            coreEdges.add(j)
+            changed.append(j)
+
+    elif e.event == Event.BRANCH:
+        j = edge_id(e.node, e.peer)
+        if edgeState[j] == EdgeState.OFF:
+            edgeState[j] = EdgeState.BRANCH_ONE_SIDE
+            changed.append(j)
+        elif edgeState[j] == EdgeState.BRANCH_ONE_SIDE:
+            edgeState[j] = EdgeState.BRANCH_TWO_SIDES
+            changed.append(j)
+
+    elif e.event == Event.REJECTED:
+        j = edge_id(e.node, e.peer)
+        if edgeState[j] == EdgeState.OFF:
+            edgeState[j] = EdgeState.REJECTED_ONE_SIDE
+            changed.append(j)
+        elif edgeState[j] == EdgeState.REJECTED_ONE_SIDE:
+            edgeState[j] = EdgeState.REJECTED_TWO_SIDES
+            changed.append(j)
+
+    elif e.event == Event.FINISHED:
+        nodeLeader[i] = e.peer
+
+    return changed
+
+def skip_event(e):
+    # Applies an event that is not drawn as a frame
+    dirtyEdges.update(apply_event(e))
+    dirtyNodes.add(nodeIndex[e.node])
+
+def is_level_change(e):
+    # Whether the event, not applied yet, moves a node to a higher level
+    return e.event == Event.RECEIVE and MESSAGE_NAMES[e.msg_type] == "INITIATE" and e.level > nodeLevel[nodeIndex[e.node]]
+
+def node_label(i):
+    if nodeLeader[i] != -1:
+        return str(nodes[i]) + "(" + str(nodeLeader[i]) + ")"
+    return str(nodes[i])
+
+# Artists drawn once by init_func. Frames only recolour the nodes and edges touched by their event
+nodeArtist = None
+edgeArtist = None
+labelArtists = {}
+titleArtist = None
+animatedArtists = []  # artists changed by the frames
+nodeColors = None  # RGBA row per node
+edgeColors = None  # RGBA row per edge
+highlightedEdge = None
+
+# Function to update the plot for each frame, one event of the trace
+def update(e):
+    global highlightedEdge
+    changed = apply_event(e)
+    changed.extend(dirtyEdges)
+    dirtyEdges.clear()
+
+    # The edge of the previous message goes back to its state color
+    if highlightedEdge is not None:
+        changed.append(highlightedEdge)
+        highlightedEdge = None
+    for j in changed:
+        edgeColors[j] = EDGE_COLORS[edgeState[j]]
+    if e.event == Event.SEND and MESSAGE_NAMES[e.msg_type] != "TERMINATE":
+        highlightedEdge = edge_id(e.node, e.peer)
+        edgeColors[highlightedEdge] = to_rgba(Color.EDGE_ON.value)
+        changed.append(highlightedEdge)
+    if changed:
+        edgeArtist.set_color(edgeColors)
+
+    i = nodeIndex[e.node]
+    dirtyNodes.add(i)
+    nodesChanged = False
+    for k in dirtyNodes:
+        nodeColor = palette[nodeColorIndex[k]]
+        if tuple(nodeColors[k]) != nodeColor:
+            nodeColors[k] = nodeColor
+            nodesChanged = True
+        if nodeLeader[k] != -1:
+            labelArtists[nodes[k]].set_text(node_label(k))
+    dirtyNodes.clear()
+    if nodesChanged:
+        nodeArtist.set_facecolor(nodeColors)
 
-    return G, pos, nodes
+    # Show the timestamp as the title of the plot
+    message = render_tag(e.event, e.msg_type, e.peer)
+    if e.event == Event.RECEIVE and MESSAGE_NAMES[e.msg_type] == "INITIATE":
+        titleArtist.set_text(f"Time: {e.timestamp}s, node: {e.node}, message: {message}, Fragment Id: {nodeFragment[i]}")
+    else:
+        titleArtist.set_text(f"Time: {e.timestamp}s, node: {e.node}, message: {message}")
 
-# Function to update the plot for each frame
-def update(frame):
-    plt.clf()  # Clear the current plot
-
-    f_self_awakened = 0
-    sNode_awakened_by = -1
-    f_awakened_by = 0
-    f_connect_to = 0
-    f_initiate_to = 0
-    f_initiate_from = 0
-    f_branch_to = 0
-    f_comm = 0
-    dNode_to = -1
-    timestamp, id, message, payload = graph_states_filtered[frame]
-
-    if message == "SELF-AWAKENED":
-        f_self_awakened = 1
-        fragmentOfNode[str(id)] = 0
-    elif message.startswith('AWAKENED by'):
-        f_awakened_by = 1
-        fragmentOfNode[str(id)] = 0
-        sNode_awakened_by = -1
-        pattern = r"AWAKENED by (\d+)"
-        match = re.match(pattern, message)
-        if match:
-            sNode_awakened_by = int(match.group(1))
-    elif message.startswith('CONNECT to ') or  message.startswith('INITIATE to ') or message.startswith('REPORT to ') or message.startswith('TEST to ') or message.startswith('ACCEPT to ') or message.startswith('REJECT to ') or message.startswith('CHANGE_ROOT to '):
-        pattern = r".* to (\d+)"
-        match = re.match(pattern, message)
-        if match:
-            f_comm = 1
-            dNode_to = int(match.group(1))
-    #     f_connect_to = 1
-    #     dNode_connect_to = -1
-    #     pattern = r"CONNECT to (\d+)"
-    #     match = re.match(pattern, message)
-    #     if match:
-    #         dNode_connect_to = int(match.group(1))
-    # elif message.startswith('INITIATE to '):
-    #     f_initiate_to = 1
-    #     dNode_initiate_to = -1
-    #     pattern = r"INITIATE to (\d+)"
-    #     match = re.match(pattern, message)
-    #     if match:
-    #         dNode_initiate_to = int(match.group(1))
-    elif message.startswith('INITIATE from '):
-#[128.000000] [host2] [INITIATE from 3] (2 <-- Initiate -- 3) : {Level = 1, Fragment id = 4, State = NodeState.FIND}
-        f_initiate_from = 1
-
-        sNode_initiate_from = -1
-        pattern = r"INITIATE from (\d+)"
-        match = re.match(pattern, message)
-        if match:
-            sNode_initiate_from = int(match.group(1))
-
-        fragmentLevel = -1
-        f_change_core_color = 0
-        pattern = r".*Level = (\d+).*"
-        match = re.match(pattern, payload)
-        if match:
-            fragmentLevel = int(match.group(1))
-            global maxFragmentLevel
-            if fragmentLevel > maxFragmentLevel:
-                f_change_core_color = 1
-                maxFragmentLevel = fragmentLevel
-
-        fragmentId = -1
-        pattern = r".*Fragment id = (\d+).*"
-        match = re.match(pattern, payload)
-        if match:
-            fragmentId = int(match.group(1))
-            fragmentOfNode[str(id)] = fragmentId
-            if fragmentColor.get(str(fragmentId)) is None:
-                global fragmentCount
-                fragmentCount += 1
-                colorCode = getattr(Color, f"F_{fragmentCount}")
-                fragmentColor[str(fragmentId)] = colorCode.value
-
-            if id < sNode_initiate_from:
-                s = id
-                d = sNode_initiate_from
-            else:
-                s = sNode_initiate_from
-                d = id
-            if edgeWeight[str(s) + str(d)] == fragmentId:
-                if f_change_core_color and Color.EDGE_CORE.value in edgeColor.values():
-                    for e in edgeColor:
-                        if edgeColor[e] == Color.EDGE_CORE.value:
-                            edgeColor[e] = Color.EDGE_BRANCH_TWO_SIDES.value
-                edgeColor[str(s) + str(d)] = Color.EDGE_CORE.value
-
-    elif message.startswith('BRANCH to '):
-        f_branch_to = 1
-        dNode_branch_to = -1
-        pattern = r"BRANCH to (\d+)"
-        match = re.match(pattern, message)
-        if match:
-            dNode_branch_to = int(match.group(1))
-            if id < dNode_branch_to:
-                s = id
-                d = dNode_branch_to
-            else:
-                s = dNode_branch_to
-                d = id
-
-            if edgeColor.get(str(s) + str(d)) == Color.EDGE_OFF.value:
-                edgeColor[str(s) + str(d)] = Color.EDGE_BRANCH_ONE_SIDE.value
-            elif edgeColor.get(str(s) + str(d)) == Color.EDGE_BRANCH_ONE_SIDE.value:
-                edgeColor[str(s) + str(d)] = Color.EDGE_BRANCH_TWO_SIDES.value
-
-    elif message.startswith('REJECTED to '):
-        dNode_rejected_to = -1
-        pattern = r"REJECTED to (\d+)"
-        match = re.match(pattern, message)
-        if match:
-            dNode_rejected_to = int(match.group(1))
-            if id < dNode_rejected_to:
-                s = id
-                d = dNode_rejected_to
-            else:
-                s = dNode_rejected_to
-                d = id
-
-            if edgeColor.get(str(s) + str(d)) == Color.EDGE_OFF.value:
-                edgeColor[str(s) + str(d)] = Color.EDGE_REJECTED_ONE_SIDE.value
-            elif edgeColor.get(str(s) + str(d)) == Color.EDGE_REJECTED_ONE_SIDE.value:
-                edgeColor[str(s) + str(d)] = Color.EDGE_REJECTED_TWO_SIDES.value
-
-    elif message.startswith('FINISHED with '):
-        pattern = r"FINISHED with leader (\d+)"
-        match = re.match(pattern, message)
-        if match:
-            leader = int(match.group(1))
-            nodeLeader[str(id)] = leader
+    return animatedArtists
 
+# Draws the graph in its current state, with one artist per nodes, edges, label and title
+def init_func():
+    global nodeArtist, edgeArtist, labelArtists, titleArtist, animatedArtists, nodeColors, edgeColors, highlightedEdge
+    plt.clf()
+    highlightedEdge = None
+    dirtyNodes.clear()
+    dirtyEdges.clear()
 
-    labels = {}
-    color_map = []
-    for node in nodes:
-        if nodeLeader[str(node)] != -1:
-            labels[int(node)] = str(node) + "(" + str(nodeLeader[str(node)]) + ")"
-        else: 
-            labels[int(node)] = str(node)
-        G.nodes[node]["color"] = fragmentColor[str(fragmentOfNode[str(node)])]
-
-    edges = G.edges()
-    for u, v in edges:
-        if u < v:
-            G[u][v]["color"] = edgeColor[str(u) + str(v)]
-        else:
-            G[v][u]["color"] = edgeColor[str(v) + str(u)] 
+    nodeColors = np.array(palette)[nodeColorIndex]
+    edgeColors = EDGE_COLORS[edgeState]
+    labels = {node: node_label(i) for i, node in enumerate(nodes)}
 
-    if f_comm == 1 and dNode_to != -1:
-        if id < dNode_to:
-            G[id][dNode_to]["color"] = Color.EDGE_ON.value
-        else:
-            G[dNode_to][id]["color"] = Color.EDGE_ON.value  
-    #if f_connect_to == 1 and dNode_connect_to != -1:
-        #if id < dNode_connect_to:
-            #G[id][dNode_connect_to]["color"] = Color.EDGE_ON.value
-        #else:
-            #G[dNode_connect_to][id]["color"] = Color.EDGE_ON.value
-
-    #elif f_initiate_to == 1 and dNode_initiate_to != -1:
-        #if id < dNode_initiate_to:
-            #G[id][dNode_initiate_to]["color"] = Color.EDGE_ON.value
-        #else:
-            #G[dNode_initiate_to][id]["color"] = Color.EDGE_ON.value
-
-    nx.draw_networkx_nodes(G, pos, node_size=2000, node_color=[G.nodes[node]["color"] for node in G])
-    nx.draw_networkx_labels(G, pos, labels, font_size=20, font_family='sans-serif')
-    nx.draw_networkx_edges(G, pos, edge_color=[G[u][v]["color"] for u,v in edges], width = 3)
-    #nx.draw_networkx_edges(G, pos, edge_color=Color.EDGE_OFF.value, width = 3)
+    nodeArtist = nx.draw_networkx_nodes(G, pos, nodelist=nodes, node_size=2000, node_color=nodeColors)
+    labelArtists = nx.draw_networkx_labels(G, pos, labels, font_size=20, font_family='sans-serif')
+    edgeArtist = nx.draw_networkx_edges(G, pos, edgelist=edges, edge_color=edgeColors, width = 3)
     edge_weights = nx.get_edge_attributes(G, 'weight')
     nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_weights, font_size=14)
 
     plt.axis('off')
-    figure = plt.gcf()
-    figure.set_size_inches(19.2, 10.8)
-    
-    # Show the timestamp as the title of the plot
-    #plt.title(f"Time: {timestamp}s, node: {id}, message: {message}, payload: {payload}", fontsize=20)
-    if f_initiate_from:
-        plt.title(f"Time: {timestamp}s, node: {id}, message: {message}, Fragment Id: {fragmentOfNode[str(id)]}", fontsize=20)
-    else:
-        plt.title(f"Time: {timestamp}s, node: {id}, message: {message}", fontsize=20)
+    titleArtist = plt.title("", fontsize=20)
+
+    animatedArtists = [nodeArtist, edgeArtist, titleArtist] + list(labelArtists.values())
+    return animatedArtists
+
+# Events between two keyframes
+KEYFRAME_INTERVAL = 1000
+# Version of the state stored in the keyframes, the stored keyframes of another version are rebuilt
+KEYFRAME_VERSION = 2
+
+def build_keyframes(log_file, interval):
+    # One pass over the log: the full state every `interval` events, with the offset of the event in
+    # the log to resume reading there, and the events that move a node to a higher level
+    reset_state()
+    keyframes = []
+    levelChanges = []
+    count = 0
+    for offset, e in scan_events(log_file):
+        if count % interval == 0:
+            keyframes.append({"index": count, "timestamp": e.timestamp, "offset": offset, "state": snapshot()})
+        if is_level_change(e):
+            levelChanges.append(count)
+        apply_event(e)
+        count += 1
+    reset_state()
+    return {"interval": interval, "count": count, "keyframes": keyframes, "levelChanges": levelChanges}
+
+def load_keyframes(log_file, graph_edges_file, interval = KEYFRAME_INTERVAL):
+    # Keyframes of a log, stored next to it in <log>.keyframes and rebuilt when the log or the graph
+    # changes, the stored states being indexed by the nodes and edges of the graph
+    index_file = log_file + ".keyframes"
+    stat = os.stat(log_file)
+    source = (KEYFRAME_VERSION, stat.st_size, stat.st_mtime_ns, file_hash(graph_edges_file), interval)
+    try:
+        with open(index_file, 'rb') as file:
+            index = pickle.load(file)
+        if index["source"] == source:
+            return index
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+    index = build_keyframes(log_file, interval)
+    index["source"] = source
+    try:
+        with open(index_file, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return index
+
+def seek(log_file, index, target):
+    # Restores the state before event `target` from the closest keyframe before it.
+    # Returns the offset of the event in the log
+    keyframes = index["keyframes"]
+    if not keyframes:
+        reset_state()
+        return None
+    keyframe = keyframes[bisect.bisect_right([k["index"] for k in keyframes], target) - 1]
+    restore(keyframe["state"])
+    i = keyframe["index"]
+    for offset, e in scan_events(log_file, keyframe["offset"]):
+        if i == target:
+            return offset
+        apply_event(e)
+        i += 1
+    return os.path.getsize(log_file)
+
+def event_at_time(log_file, index, time, after = False):
+    # Index of the first event at `time` or later (strictly later with after), found from the keyframes
+    keyframes = index["keyframes"]
+    if not keyframes:
+        return 0
+    # Last keyframe before the searched event: events at `time` may come before a keyframe at `time`,
+    # unless they are skipped with after
+    timestamps = [keyframe["timestamp"] for keyframe in keyframes]
+    k = max((bisect.bisect_right if after else bisect.bisect_left)(timestamps, time) - 1, 0)
+    i = keyframes[k]["index"]
+    for _, e in scan_events(log_file, keyframes[k]["offset"]):
+        if e.timestamp > time or (e.timestamp == time and not after):
+            return i
+        i += 1
+    return index["count"]
+
+def frame_events(log_file, offset, frames):
+    # Streams the log from `offset`, the event frames[0], and yields the events listed in `frames`,
+    # a sorted list of event indices. The events between two frames are applied without being drawn
+    i = frames[0]
+    k = 0
+    for e in read_events(log_file, offset):
+        if i == frames[k]:
+            yield e
+            k += 1
+            if k == len(frames):
+                return
+        else:
+            skip_event(e)
+        i += 1
 
-    #print("")
+# Frames below which a segment is not worth its own process and video
+MIN_SEGMENT_FRAMES = 50
 
-def init_func():
-    pass
+def render_segment(segment):
+    # Renders the given frames (event indices) of the log into their own video. The graph state of
+    # the first frame is restored from the closest keyframe, the events after it are applied without drawing
+    global G, pos
+    graph_edges_file, positions, log_file, interval, frames, output_file = segment
+    G, pos, _ = load_graph(graph_edges_file, positions)
+    offset = seek(log_file, load_keyframes(log_file, graph_edges_file, interval), frames[0])
+
+    fig = plt.gcf()
+    fig.set_size_inches(19.2, 10.8)
+    animation = FuncAnimation(fig, update, frames=lambda: frame_events(log_file, offset, frames), interval=1000,
+                              init_func=init_func, save_count=len(frames), cache_frame_data=False)
+    animation.save(output_file, writer='ffmpeg')
+    plt.close(fig)
+    return output_file
+
+def concat_videos(parts, output_file):
+    # Joins the segment videos without re-encoding them, they all come from the same writer settings
+    list_file = output_file + ".parts.txt"
+    with open(list_file, 'w') as file:
+        for part in parts:
+            file.write(f"file '{os.path.abspath(part)}'\n")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", output_file],
+                   check=True)
+    for part in parts:
+        os.remove(part)
+    os.remove(list_file)
+
+def render_video(graph_edges_file, positions, log_file, interval, frames, output_file, jobs):
+    # Splits the frames into one segment per job, renders the segments in parallel and joins them
+    if not frames:
+        return
+    segments = max(1, min(jobs, len(frames) // MIN_SEGMENT_FRAMES))
+    bounds = [len(frames) * k // segments for k in range(segments + 1)]
+    if segments == 1:
+        render_segment((graph_edges_file, positions, log_file, interval, frames, output_file))
+        return
+    parts = [(graph_edges_file, positions, log_file, interval, frames[bounds[k]:bounds[k + 1]], f"{output_file}.part{k}.mp4")
+             for k in range(segments)]
+    with ProcessPoolExecutor(max_workers = segments) as pool:
+        concat_videos(list(pool.map(render_segment, parts)), output_file)
 
 if __name__=='__main__':
+    parser = argparse.ArgumentParser(description="Plot the evolution of the GHS fragments from a run log")
+    parser.add_argument("log", nargs="?", default="out/log_file.log", help="text log, or binary trace (--trace=binary)")
+    parser.add_argument("--graph", default="in/graph.txt", help="edge list of the simulated graph")
+    parser.add_argument("--output", default="out/graph_evolution.mp4", help="video of the run")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="processes rendering video segments in parallel")
+    parser.add_argument("--start-time", type=float, help="first simulated time shown")
+    parser.add_argument("--end-time", type=float, help="last simulated time shown")
+    parser.add_argument("--every", type=int, default=1, help="draw one event out of N")
+    parser.add_argument("--levels", action="store_true", help="only draw the events that move a node to a higher level")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL, help="events between two stored states of the run")
+    parser.add_argument("--layout", choices=["auto"] + list(LAYOUTS), default="auto",
+                        help=f"node positions, auto is spring up to {LARGE_GRAPH_NODES} nodes and spectral above")
+    parser.add_argument("--layout-cache", default=LAYOUT_CACHE, help="where computed layouts are kept, empty to disable")
+    args = parser.parse_args()
+
     # Create graph
-    graph_edges_file = 'in/graph.txt'
-    G, pos, nodes = load_graph(graph_edges_file)
+    graph_edges_file = args.graph
+    G, pos, nodes = load_graph(graph_edges_file, layout=args.layout, cache_dir=args.layout_cache)
 
     # Create config for initial graph plot
     edge_weights = nx.get_edge_attributes(G, 'weight')
@@ -316,29 +493,18 @@ if __name__=='__main__':
     plt.clf()
 
 
-    # Read graph evolution from log
-    log_file = 'out/log_file.log'
-    graph_states = read_log_file(log_file)
-
-    # Filter only for SELF-AWAKENED, AWAKENED by, INITIATE from, 
-    #graph_states_filtered = [graph_state for graph_state in graph_states \
-    #if graph_state[2] == "SELF-AWAKENED" or graph_state[2].startswith('AWAKENED by') or graph_state[2].startswith('INITIATE from') \
-    #or graph_state[2].startswith('BRANCH to')]
-
-    graph_states_filtered = graph_states
-
-    # Plot graph evolution
-    #for graph_state in graph_states_filtered:
-        #print(graph_state)
-
-    fig = plt.gcf()
-    fig.set_size_inches(19.2, 10.8)
-    framesCount = len(graph_states_filtered)
-    print(f"No. of frames: {framesCount}")
-    animation = FuncAnimation(fig, update, frames=framesCount, interval=1000, init_func=init_func)
-
-    output_file = 'out/graph_evolution.mp4'
-    animation.save(output_file, writer='ffmpeg')
+    # Graph evolution from the text log, or from a binary trace (--trace=binary).
+    # The events are streamed from the file for every pass, never loaded in memory
+    log_file = args.log
+    index = load_keyframes(log_file, graph_edges_file, args.keyframe_interval)
+    first = 0 if args.start_time is None else event_at_time(log_file, index, args.start_time)
+    stop = index["count"] if args.end_time is None else event_at_time(log_file, index, args.end_time, after=True)
+    if args.levels:
+        frames = [i for i in index["levelChanges"] if first <= i < stop]
+    else:
+        frames = list(range(first, stop, args.every))
+    print(f"No. of frames: {len(frames)}")
+    render_video(graph_edges_file, pos, log_file, args.keyframe_interval, frames, args.output, args.jobs)
 
     plt.clf()
     # Create mst verification graph
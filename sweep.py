@@ -0,0 +1,84 @@
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import benchmark
+
+# Runs AsynchGHS.py once per (graph, seed) pair on all cores. Every finished run is appended to
+# out/sweep.jsonl as soon as it completes, and the runs are aggregated per graph at the end.
+#
+#   python sweep.py --graphs ring:64 sparse:256 --scenarios in/10-nodes-network --seeds 100
+
+AGGREGATED = ["messages", "completion_time", "deferred", "max_level", "wall_time"]
+
+def run_one(graph, platform, deployment, seed, workdir, options, timeout, verify):
+    stats_path = os.path.join(workdir, f"{graph.replace(':', '-').replace(os.sep, '_')}.{seed}.stats.json")
+    result = {"graph": graph, "seed": seed}
+    result.update(benchmark.run_simulation(platform, deployment, stats_path, list(options) + [f"--seed={seed}"], timeout, verify))
+    # The per-node counters are not aggregated, keep the streamed lines small
+    for key in ("messages_by_node", "deferred_by_node"):
+        result.pop(key, None)
+    return result
+
+def aggregate(results):
+    rows = []
+    graphs = sorted({result["graph"] for result in results})
+    for graph in graphs:
+        runs = [result for result in results if result["graph"] == graph]
+        ok = [result for result in runs if result["status"] == "ok"]
+        row = {"graph": graph, "runs": len(runs), "failed": len(runs) - len(ok),
+               "wrong": sum(1 for result in ok if result.get("verified") == "fail")}
+        for key in AGGREGATED:
+            values = [result[key] for result in ok]
+            if values:
+                row[f"{key}_mean"] = round(statistics.mean(values), 3)
+                row[f"{key}_min"] = min(values)
+                row[f"{key}_max"] = max(values)
+        rows.append(row)
+    return rows
+
+def scenarios(args):
+    # Yields (graph, platform, deployment) for the generated graphs and the existing scenarios
+    for graph in args.graphs:
+        family, n = graph.split(":")
+        platform, deployment = benchmark.generate_scenario(family, int(n), args.workdir)
+        yield graph, platform, deployment
+    for prefix in args.scenarios:
+        yield prefix, prefix + ".xml", prefix + "_d.xml"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Run AsynchGHS.py for many seeds and topologies in parallel")
+    parser.add_argument("--graphs", nargs = "*", default = [], help = "generated graphs as family:nodes, families: " + ", ".join(benchmark.FAMILIES))
+    parser.add_argument("--scenarios", nargs = "*", default = [], help = "existing scenarios as <prefix> of <prefix>.xml and <prefix>_d.xml")
+    parser.add_argument("--seeds", type = int, default = 10, help = "runs per graph, with seeds 0..seeds-1")
+    parser.add_argument("--jobs", type = int, default = os.cpu_count(), help = "parallel simulations")
+    parser.add_argument("--workdir", default = "out/sweep", help = "where scenarios and run counters are written")
+    parser.add_argument("--output", default = "out/sweep", help = "writes <output>.jsonl (every run) and <output>.csv (aggregate)")
+    parser.add_argument("--timeout", type = float, default = 600, help = "seconds before a run is killed")
+    parser.add_argument("--verify", action = "store_true", help = "check the MST and leader of every run, counted as wrong when they do not hold")
+    args, options = parser.parse_known_args()  # unknown options are passed to AsynchGHS.py
+    os.makedirs(args.workdir, exist_ok = True)
+
+    results = []
+    with ProcessPoolExecutor(max_workers = args.jobs) as pool, open(args.output + ".jsonl", 'w') as stream:
+        futures = [pool.submit(run_one, graph, platform, deployment, seed, args.workdir, options, args.timeout, args.verify)
+                   for graph, platform, deployment in scenarios(args) for seed in range(args.seeds)]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            stream.write(json.dumps(result) + "\n")
+            stream.flush()
+            print(f"[{done}/{len(futures)}] {result['graph']} seed {result['seed']}: {result['status']} {result.get('verified', '')}", file = sys.stderr)
+
+    rows = aggregate(results)
+    columns = ["graph", "runs", "failed", "wrong"] + [f"{key}_{stat}" for key in AGGREGATED for stat in ("mean", "min", "max")]
+    with open(args.output + ".csv", 'w', newline = '') as file:
+        writer = csv.DictWriter(file, fieldnames = columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    for row in rows:
+        print(", ".join(f"{key} = {row[key]}" for key in columns if key in row))
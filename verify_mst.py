@@ -0,0 +1,111 @@
+import argparse
+import sys
+import xml.etree.ElementTree as ET
+
+from ghs_graph import parse_links, read_edge_list
+from ghs_trace import Event, read_events
+
+# Checks a GHS run without plotting it: the Branch edges marked on both sides must be the minimum
+# spanning tree of the graph (Kruskal with the (weight, min id, max id) order of AsynchGHS.py), and
+# every node must finish with the same leader. Exits with 0 when both hold, 1 otherwise.
+#
+#   python verify_mst.py out/log_file.log
+#   python verify_mst.py out/trace.bin --graph in/10-nodes-network_d.xml
+
+def deployment_edges(path):
+    # {(u, v): weight} with u < v, from the actor arguments of a deployment, read as AsynchGHS.py does
+    edges = {}
+    for actor in ET.parse(path).getroot().iter("actor"):
+        arguments = [argument.get("value") for argument in actor.iter("argument")]
+        node = int(arguments[0])
+        for neighbour, weight in parse_links(node, arguments[1]):
+            edges[(min(node, neighbour), max(node, neighbour))] = weight
+    return edges
+
+def graph_edges(path):
+    # {(u, v): weight} with u < v, from a deployment or from a "src dst weight" edge list
+    if path.endswith(".xml"):
+        return deployment_edges(path)
+    return {(min(u, v), max(u, v)): weight for u, v, weight in read_edge_list(path)}
+
+def find(parent, u):
+    while parent[u] != u:
+        parent[u] = parent[parent[u]]
+        u = parent[u]
+    return u
+
+def kruskal(edges):
+    # Minimum spanning forest, as the set of its (u, v) edges
+    parent = {}
+    for u, v in edges:
+        parent[u] = u
+        parent[v] = v
+    tree = set()
+    for weight, u, v in sorted((weight, u, v) for (u, v), weight in edges.items()):
+        root_u, root_v = find(parent, u), find(parent, v)
+        if root_u != root_v:
+            parent[root_u] = root_v
+            tree.add((u, v))
+    return tree
+
+def run_outcome(trace_path):
+    # Edges marked Branch by both of their ends, the number of events and Branch marks seen,
+    # and the leaders of every finished node
+    sides = {}
+    count = 0
+    marks = 0
+    leaders = {}
+    for e in read_events(trace_path):
+        count += 1
+        if e.event == Event.BRANCH:
+            marks += 1
+            edge = (min(e.node, e.peer), max(e.node, e.peer))
+            sides.setdefault(edge, set()).add(e.node)
+        elif e.event == Event.FINISHED:
+            leaders.setdefault(e.node, []).append(e.peer)
+    branches = {edge for edge, ends in sides.items() if len(ends) == 2}
+    return branches, count, marks, leaders
+
+def verify(edges, trace_path):
+    # Returns (ok, report lines)
+    report = []
+    nodes = {u for edge in edges for u in edge}
+    branches, count, marks, leaders = run_outcome(trace_path)
+    if count == 0:
+        return False, [f"{trace_path} has no GHS event, text logs need the [%r] [%h] %m%n log format of ghs.sh"]
+
+    mst = kruskal(edges)
+    if marks == 0:
+        report.append("MST: FAIL, the trace has no BRANCH event (run with --trace=text, verbose or binary)")
+        mst_ok = False
+    else:
+        missing = sorted(mst - branches)
+        extra = sorted(branches - mst)
+        mst_ok = not missing and not extra
+        if mst_ok:
+            report.append(f"MST: ok, {len(mst)} edges of total weight {sum(edges[edge] for edge in mst)}")
+        else:
+            report.append(f"MST: FAIL, {len(missing)} MST edges not in the Branch edges {missing[:10]}, "
+                          f"{len(extra)} Branch edges not in the MST {extra[:10]}")
+
+    unfinished = sorted(nodes - set(leaders))
+    repeated = sorted(node for node, node_leaders in leaders.items() if len(node_leaders) > 1)
+    elected = {leader for node_leaders in leaders.values() for leader in node_leaders}
+    leader_ok = not unfinished and not repeated and len(elected) == 1 and elected <= nodes
+    if leader_ok:
+        report.append(f"Leader: ok, {elected.pop()} agreed by all {len(nodes)} nodes")
+    else:
+        report.append(f"Leader: FAIL, leaders {sorted(elected)[:10]}, {len(unfinished)} nodes never finished {unfinished[:10]}, "
+                      f"{len(repeated)} nodes finished more than once {repeated[:10]}")
+    return mst_ok and leader_ok, report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Check the MST and the leader of a GHS run from its trace")
+    parser.add_argument("trace", nargs = "?", default = "out/log_file.log", help = "text log, or binary trace (--trace=binary)")
+    parser.add_argument("--graph", default = "in/graph.txt", help = "edge list of the graph, or the deployment file of the run")
+    args = parser.parse_args()
+
+    ok, report = verify(graph_edges(args.graph), args.trace)
+    for line in report:
+        print(line)
+    sys.exit(0 if ok else 1)